@@ -0,0 +1,107 @@
+import logging
+from uuid import uuid4
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django_celery_beat.schedulers import DatabaseScheduler
+
+from config.settings import BEAT_LEADER_LOCK_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+BEAT_LEADER_KEY = "lock:celery-beat-leader"
+
+# Продление и снятие блокировки — сравнение токена и действие одной атомарной командой Redis
+RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def redis_client(key):
+    """Клиент Redis общего кэша или None, если кэш не Redis (локальный кэш процесса без CACHE_LOCATION)"""
+    backend = caches["default"]
+    if not isinstance(backend, RedisCache):
+        return None
+    return backend._cache.get_client(key, write=True)
+
+
+class LeaderDatabaseScheduler(DatabaseScheduler):
+    """
+    Планировщик django_celery_beat для beat на нескольких узлах. Задачи отправляет только лидер,
+    который держит блокировку в общем кэше (Redis) и продлевает ее на каждом такте;
+    остальные узлы ждут и занимают место лидера, когда блокировка истечет.
+    Расписание читается из БД, CELERY_BEAT_SCHEDULE переносит туда команда sync_beat_schedule.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.leader_token = uuid4().hex
+        self.is_leader = False
+        self.redis = redis_client(BEAT_LEADER_KEY)
+        if self.redis is None:
+            logger.error(
+                "Кэш не общий (не задан CACHE_LOCATION): блокировка лидера beat действует только внутри процесса, "
+                "запускать beat на нескольких узлах нельзя"
+            )
+        else:
+            self.leader_key = cache.make_and_validate_key(BEAT_LEADER_KEY)
+            self.renew_script = self.redis.register_script(RENEW_SCRIPT)
+            self.release_script = self.redis.register_script(RELEASE_SCRIPT)
+        super().__init__(*args, **kwargs)
+
+    def setup_schedule(self):
+        # Расписание из настроек не перезаписывается при запуске каждого узла: его переносит sync_beat_schedule
+        self.install_default_entries(self.schedule)
+
+    def acquire_lock(self):
+        if self.redis is None:
+            return cache.add(BEAT_LEADER_KEY, self.leader_token, BEAT_LEADER_LOCK_TIMEOUT)
+        return bool(self.redis.set(self.leader_key, self.leader_token, nx=True, px=BEAT_LEADER_LOCK_TIMEOUT * 1000))
+
+    def renew_lock(self):
+        if self.redis is None:
+            return cache.get(BEAT_LEADER_KEY) == self.leader_token and cache.touch(
+                BEAT_LEADER_KEY, BEAT_LEADER_LOCK_TIMEOUT
+            )
+        args = [self.leader_token, BEAT_LEADER_LOCK_TIMEOUT * 1000]
+        return bool(self.renew_script(keys=[self.leader_key], args=args))
+
+    def release_lock(self):
+        if self.redis is None:
+            if cache.get(BEAT_LEADER_KEY) == self.leader_token:
+                cache.delete(BEAT_LEADER_KEY)
+            return
+        self.release_script(keys=[self.leader_key], args=[self.leader_token])
+
+    def elect(self):
+        """Захватывает или продлевает блокировку лидера; возвращает True, если этот узел — лидер"""
+        leader = (self.is_leader and self.renew_lock()) or self.acquire_lock()
+        if leader and not self.is_leader:
+            logger.info("Узел beat стал лидером")
+            # Прежний лидер мог запускать задачи: время запусков перечитывается из БД
+            self._initial_read = True
+            self._heap = None
+        elif self.is_leader and not leader:
+            logger.warning("Узел beat потерял лидерство")
+        self.is_leader = leader
+        return leader
+
+    def tick(self, *args, **kwargs):
+        if not self.elect():
+            return BEAT_LEADER_LOCK_TIMEOUT / 3
+        # Лидер просыпается чаще, чем истекает блокировка, чтобы успеть ее продлить
+        return min(super().tick(*args, **kwargs), BEAT_LEADER_LOCK_TIMEOUT / 3)
+
+    def close(self):
+        super().close()
+        if self.is_leader:
+            self.release_lock()
+        self.is_leader = False
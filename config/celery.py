@@ -8,11 +8,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 # Создание экземпляра объекта Celery
 app = Celery('config')
 
-# Загрузка настроек из файла Django
+# Загрузка настроек из файла Django, в том числе пула воркера (для Windows CELERY_WORKER_POOL=solo) и очередей
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Автоматическое обнаружение и регистрация задач из файлов tasks.py в приложениях Django
 app.autodiscover_tasks()
-
-# Настройка пула процессов для Windows
-app.conf.worker_pool = 'solo'
\ No newline at end of file
@@ -0,0 +1,133 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from config.settings import REPLICA_DATABASES, REPLICA_PIN_SECONDS
+
+PRIMARY = "default"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+# Запросы к этим путям всегда идут в основную БД: админка сразу показывает сохраненные изменения
+PRIMARY_PATHS = ("/admin/",)
+
+# Куда идут чтения в текущем контексте: True — на реплику, иначе на основную БД
+_read_from_replica = ContextVar("read_from_replica", default=False)
+
+
+def pin_cache_keys(request):
+    """
+    Ключи кэша «клиент недавно писал, его чтения идут в основную БД»: по пользователю из access-токена
+    и по сессии — для входа через сессию (админка, browsable API)
+    """
+    keys = []
+    user_id = request_user_id(request)
+    if user_id is not None:
+        keys.append(f"db:pinned:{user_id}")
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session_key:
+        keys.append(f"db:pinned:session:{session_key}")
+    return keys
+
+
+@contextmanager
+def routing(replica):
+    token = _read_from_replica.set(replica)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+def use_replica():
+    """Чтения внутри блока идут на реплику, например в задачах Celery, которым не нужны свежие записи"""
+    return routing(True)
+
+
+def use_primary():
+    """Чтения внутри блока идут в основную БД"""
+    return routing(False)
+
+
+class ReplicaRouter:
+    """
+    Чтения в контексте use_replica() распределяются по репликам, остальные запросы идут в основную БД.
+    Внутри транзакции и после первой записи в контексте чтения тоже идут в основную БД.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not REPLICA_DATABASES or not _read_from_replica.get() or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return random.choice(REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        # Следующие чтения должны видеть эту запись
+        _read_from_replica.set(False)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = (PRIMARY, *REPLICA_DATABASES)
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+def request_user_id(request):
+    """id пользователя из access-токена; подпись проверяется без обращения к БД"""
+    header = request.headers.get("Authorization", "").split()
+    if len(header) != 2 or header[0] not in api_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        return AccessToken(header[1])[api_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Отправляет чтения GET-запросов на реплики. После изменяющего запроса пользователь (по токену или сессии)
+    на REPLICA_PIN_SECONDS закрепляется за основной БД, чтобы сразу видеть свои изменения.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not REPLICA_DATABASES or request.path.startswith(PRIMARY_PATHS):
+            return self.get_response(request)
+        keys = pin_cache_keys(request)
+        if request.method not in SAFE_METHODS:
+            with use_primary():
+                response = self.get_response(request)
+            cache.set_many(dict.fromkeys(keys, True), REPLICA_PIN_SECONDS)
+            return response
+        pinned = bool(keys) and bool(cache.get_many(keys))
+        with routing(not pinned):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not REPLICA_DATABASES or request.path.startswith(PRIMARY_PATHS):
+            return await self.get_response(request)
+        keys = pin_cache_keys(request)
+        if request.method not in SAFE_METHODS:
+            with use_primary():
+                response = await self.get_response(request)
+            await cache.aset_many(dict.fromkeys(keys, True), REPLICA_PIN_SECONDS)
+            return response
+        pinned = bool(keys) and bool(await cache.aget_many(keys))
+        with routing(not pinned):
+            return await self.get_response(request)
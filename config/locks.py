@@ -0,0 +1,33 @@
+from contextlib import asynccontextmanager, contextmanager
+from uuid import uuid4
+
+from django.core.cache import cache
+
+
+@contextmanager
+def cache_lock(name, timeout):
+    """
+    Распределённая блокировка на общем кэше (Redis).
+    Возвращает True, если блокировка получена; освобождает только свою блокировку.
+    """
+    key = f"lock:{name}"
+    token = uuid4().hex
+    acquired = cache.add(key, token, timeout)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(key) == token:
+            cache.delete(key)
+
+
+@asynccontextmanager
+async def acache_lock(name, timeout):
+    """Асинхронный вариант cache_lock"""
+    key = f"lock:{name}"
+    token = uuid4().hex
+    acquired = await cache.aadd(key, token, timeout)
+    try:
+        yield acquired
+    finally:
+        if acquired and await cache.aget(key) == token:
+            await cache.adelete(key)
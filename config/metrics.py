@@ -0,0 +1,204 @@
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from hmac import compare_digest
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+from config.settings import DUPLICATE_QUERY_THRESHOLD, METRICS_TOKEN, SERVER_TIMING
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class QueryCollector:
+    """Обёртка execute_wrapper: считает и замеряет SQL-запросы одного HTTP-запроса"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    def duplicates(self):
+        """Запросы с одинаковым SQL, повторённые не меньше DUPLICATE_QUERY_THRESHOLD раз (признак N+1)"""
+        return {sql: n for sql, n in self.statements.items() if n >= DUPLICATE_QUERY_THRESHOLD}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """Гистограммы по маршрутам в памяти процесса: каждый воркер отдаёт свои значения"""
+
+    metrics = (
+        ("http_request_duration_seconds", "Время обработки запроса", DURATION_BUCKETS),
+        ("http_request_db_duration_seconds", "Время SQL-запросов за запрос", DURATION_BUCKETS),
+        ("http_request_db_queries", "Число SQL-запросов за запрос", QUERY_BUCKETS),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {name: {} for name, _, _ in self.metrics}
+            self.duplicates = defaultdict(int)
+
+    def observe(self, labels, duration, collector):
+        values = (duration, collector.duration, collector.count)
+        with self.lock:
+            for (name, _, buckets), value in zip(self.metrics, values):
+                self.histograms[name].setdefault(labels, Histogram(buckets)).observe(value)
+            if collector.duplicates():
+                self.duplicates[labels] += 1
+
+    def render(self):
+        """Текстовый формат Prometheus"""
+        lines = []
+        with self.lock:
+            for name, description, _ in self.metrics:
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+                for labels, histogram in sorted(self.histograms[name].items()):
+                    label = format_labels(labels)
+                    for bound, value in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {value}')
+                    lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.total}')
+                    lines.append(f"{name}_sum{{{label}}} {histogram.sum}")
+                    lines.append(f"{name}_count{{{label}}} {histogram.total}")
+            name = "http_requests_with_duplicate_queries_total"
+            lines += [f"# HELP {name} Запросы с повторяющимся SQL (N+1)", f"# TYPE {name} counter"]
+            for labels, value in sorted(self.duplicates.items()):
+                lines.append(f"{name}{{{format_labels(labels)}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    route, method = labels
+    route = route.replace("\\", "\\\\").replace('"', '\\"')
+    return f'route="{route}",method="{method}"'
+
+
+registry = MetricsRegistry()
+
+
+def route_label(request):
+    """Шаблон маршрута вместо пути, чтобы число рядов метрик не зависело от id в адресе"""
+    match = request.resolver_match
+    return match.route if match else "unmatched"
+
+
+def server_timing(duration, collector):
+    db = collector.duration * 1000
+    total = duration * 1000
+    timings = [
+        f'db;dur={db:.1f};desc="{collector.count} queries"',
+        f"app;dur={max(total - db, 0):.1f}",
+        f"total;dur={total:.1f}",
+    ]
+    duplicates = collector.duplicates()
+    if duplicates:
+        timings.append(f'dup;desc="{len(duplicates)} repeated statements"')
+    return ", ".join(timings)
+
+
+class QueryMetricsMiddleware:
+    """
+    Считает и замеряет SQL-запросы каждого HTTP-запроса через execute_wrapper на всех соединениях,
+    отдаёт разбивку в заголовке Server-Timing и копит гистограммы по маршрутам для /metrics/.
+    Повторяющиеся запросы логируются как вероятный N+1.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        collector = QueryCollector()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            response = self.get_response(request)
+        return self.finish(request, response, time.perf_counter() - start, collector)
+
+    async def __acall__(self, request):
+        # Под ASGI синхронный код запроса выполняется в одном потоке,
+        # поэтому обёртку ставим на соединения этого потока
+        collector = QueryCollector()
+        start = time.perf_counter()
+        await sync_to_async(self.attach)(collector)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(self.detach)(collector)
+        return self.finish(request, response, time.perf_counter() - start, collector)
+
+    @staticmethod
+    def attach(collector):
+        for connection in connections.all():
+            connection.execute_wrappers.append(collector)
+
+    @staticmethod
+    def detach(collector):
+        for connection in connections.all():
+            connection.execute_wrappers.remove(collector)
+
+    def finish(self, request, response, duration, collector):
+        labels = (route_label(request), request.method)
+        registry.observe(labels, duration, collector)
+        duplicates = collector.duplicates()
+        if duplicates:
+            logger.warning(
+                "Повторяющиеся SQL-запросы на %s %s: %s",
+                request.method,
+                labels[0],
+                "; ".join(f"{n}x {sql[:200]}" for sql, n in duplicates.items()),
+            )
+        if SERVER_TIMING:
+            response["Server-Timing"] = server_timing(duration, collector)
+        return response
+
+
+def metrics_view(request):
+    """
+    Метрики в текстовом формате Prometheus. Доступ по заголовку Authorization: Bearer с METRICS_TOKEN
+    или для персонала (is_staff); без заданного токена остается только второй вариант.
+    """
+    authorized = METRICS_TOKEN and compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}")
+    if not authorized and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
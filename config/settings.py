@@ -29,6 +29,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     "rest_framework",
     "rest_framework_simplejwt",
@@ -40,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'config.metrics.QueryMetricsMiddleware',
+    'config.db_router.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,6 +54,13 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'config.urls'
 
+# Заголовок Server-Timing с разбивкой времени запроса на SQL и остальное; по умолчанию только в DEBUG
+SERVER_TIMING = os.getenv("SERVER_TIMING", str(DEBUG)) == "True"
+# Сколько раз одинаковый SQL должен повториться за запрос, чтобы считаться N+1
+DUPLICATE_QUERY_THRESHOLD = 3
+# Токен для /metrics/; без токена метрики доступны только персоналу
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -69,6 +79,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
+# Асинхронные представления чтения; включаются в config/asgi.py, под WSGI работают синхронные
+ASYNC_READ_VIEWS = os.getenv("ASYNC_READ_VIEWS", False) == "True"
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -84,6 +97,41 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения (хосты через запятую) с той же БД и пользователем, что у основной.
+# Чтения GET-запросов идут на реплики, после своей записи пользователь REPLICA_PIN_SECONDS читает из основной БД
+REPLICA_DATABASES = []
+for number, host in enumerate(filter(None, os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",")), start=1):
+    alias = f"replica_{number}"
+    DATABASES[alias] = {**DATABASES["default"], "HOST": host.strip(), "TEST": {"MIRROR": "default"}}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ["config.db_router.ReplicaRouter"]
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Кэш должен быть общим для всех процессов и воркеров Celery: на нем держатся версии закэшированных ответов,
+# отзыв токенов и блокировки. Без CACHE_LOCATION (например, redis://redis:6379/1) используется локальный кэш
+# процесса — только для разработки и тестов, manage.py check --deploy об этом предупреждает
+
+CACHE_LOCATION = os.getenv("CACHE_LOCATION")
+
+if CACHE_LOCATION:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_LOCATION,
+        }
+    }
+
+# Время жизни закэшированных ответов API и блокировки на время их пересборки (в секундах)
+RESPONSE_CACHE_TIMEOUT = 60 * 15
+RESPONSE_CACHE_REBUILD_TIMEOUT = 30
+
+# Конфигурация полнотекстового поиска Postgres
+SEARCH_CONFIG = "russian"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -124,6 +172,10 @@ STATIC_URL = 'static/'
 
 AUTH_USER_MODEL = "users.User"
 
+# Группа модераторов и время жизни закэшированной роли пользователя (в секундах)
+MODERATORS_GROUP = "moders"
+ROLE_CACHE_TIMEOUT = 60 * 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -132,11 +184,20 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = "media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Варианты превью и аватаров: размер по длинной стороне и форматы, их создает задача Celery
+IMAGE_VARIANT_SIZES = {"small": 320, "medium": 640, "large": 1280}
+IMAGE_VARIANT_FORMATS = ("webp", "jpeg")
+IMAGE_VARIANT_QUALITY = 80
+
+# JWT_STATELESS_AUTH=True включает аутентификацию по claims токена без загрузки пользователя из БД
+JWT_STATELESS_AUTH = os.getenv("JWT_STATELESS_AUTH", False) == "True"
+
 REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": [
         "django_filters.rest_framework.DjangoFilterBackend", ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication', ],
+        'users.authentication.StatelessJWTAuthentication' if JWT_STATELESS_AUTH
+        else 'rest_framework_simplejwt.authentication.JWTAuthentication', ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated", ],
 }
@@ -144,8 +205,13 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=120),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.ClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.ClaimsTokenRefreshSerializer",
 }
 
+# Время жизни закэшированной версии токенов пользователя (в секундах)
+TOKEN_VERSION_CACHE_TIMEOUT = 60 * 60
+
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")  # Например, Redis, который по умолчанию работает на порту 6379
 
 # URL-адрес брокера результатов, также Redis
@@ -162,14 +228,63 @@ CELERY_TASK_TIME_LIMIT = 30 * 60
 
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
+# Пул воркера: prefork, threads, gevent или solo (для Windows); без CELERY_WORKER_CONCURRENCY — по числу CPU.
+# Множитель предвыборки 1: воркер не забирает задачи впрок, пока занят долгой задачей
+CELERY_WORKER_POOL = os.getenv("CELERY_WORKER_POOL", "prefork")
+CELERY_WORKER_CONCURRENCY = int(os.getenv("CELERY_WORKER_CONCURRENCY", 0)) or None
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.getenv("CELERY_WORKER_PREFETCH_MULTIPLIER", 1))
+
+# Очереди задач: письма, платежи и служебные задачи обслуживают отдельные воркеры
+# (celery -A config worker -Q email), поэтому всплеск рассылок не задерживает остальную работу
+CELERY_TASK_DEFAULT_QUEUE = "default"
+TASK_QUEUES = {
+    "materials.tasks.send_info": "email",
+    "materials.tasks.notify_course_subscribers": "email",
+    "users.tasks.create_payment_session": "payments",
+    "materials.tasks.deactivate_user": "maintenance",
+}
+TASK_QUEUE_POLICIES = {
+    # Повтор после падения воркера отправил бы пачку писем дважды, поэтому подтверждение сразу
+    "email": {"acks_late": False, "time_limit": 5 * 60, "ignore_result": True},
+    # Задача проверяет статус платежа, повтор безопасен; результат хранится в самом платеже
+    # soft_time_limit оставляет задаче время отметить платеж до принудительной остановки по time_limit
+    "payments": {"acks_late": True, "soft_time_limit": 45, "time_limit": 60, "ignore_result": True},
+    # Деактивация повторяема и защищена блокировкой; результат — число деактивированных
+    "maintenance": {"acks_late": True, "time_limit": 60 * 60, "ignore_result": False},
+}
+CELERY_TASK_ROUTES = {task: {"queue": queue} for task, queue in TASK_QUEUES.items()}
+CELERY_TASK_ANNOTATIONS = {task: TASK_QUEUE_POLICIES[queue] for task, queue in TASK_QUEUES.items()}
+
+# Расписание хранится в БД (django_celery_beat), CELERY_BEAT_SCHEDULE переносит туда
+# команда sync_beat_schedule. Beat можно запускать на нескольких узлах: задачи отправляет
+# только лидер, который держит блокировку в общем кэше (нужен CACHE_LOCATION)
+CELERY_BEAT_SCHEDULER = "config.beat.LeaderDatabaseScheduler"
+BEAT_LEADER_LOCK_TIMEOUT = 30
+
 CELERY_BEAT_SCHEDULE = {
-    'task-name': {
-        'task': 'courses.tasks.deactivate_user',  # Путь к задаче
-        'schedule': timedelta(seconds=10),  # Расписание выполнения задачи (например, каждые 10 минут)
+    'deactivate-inactive-users': {
+        'task': 'materials.tasks.deactivate_user',  # Путь к задаче
+        'schedule': timedelta(days=1),  # Расписание выполнения задачи
     },
 }
 
+# Размер пачки UPDATE и время жизни блокировки задачи деактивации пользователей
+DEACTIVATE_USER_BATCH_SIZE = 1000
+DEACTIVATE_USER_LOCK_TIMEOUT = 60 * 60
+
+# Количество адресов в одной задаче рассылки уведомлений
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", 500))
+
+# Сколько строк выгрузки платежей читается из курсора и отдается клиенту за раз
+PAYMENT_EXPORT_CHUNK_SIZE = 2000
+
 STRIPE_API_KEY = os.getenv("STRIPE_API_KEY")
+# Для работы без сети: STRIPE_CLIENT=users.services.FakeStripeClient
+STRIPE_CLIENT = os.getenv("STRIPE_CLIENT", "users.services.StripeClient")
+STRIPE_SUCCESS_URL = os.getenv("STRIPE_SUCCESS_URL", "http://127.0.0.1:8000/courses/")
+# Таймаут одного запроса к Stripe в секундах (в библиотеке по умолчанию 80): задача платежа делает
+# до трех запросов и должна уложиться в soft_time_limit очереди payments
+STRIPE_TIMEOUT = int(os.getenv("STRIPE_TIMEOUT", 10))
 
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = os.getenv("EMAIL_HOST")
@@ -4,6 +4,8 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from config.metrics import metrics_view
+
 
 schema_view = get_schema_view(
    openapi.Info(
@@ -20,6 +22,7 @@ schema_view = get_schema_view(
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics/', metrics_view, name='metrics'),
     path("", include("materials.urls", namespace="materials")),
     path("users/", include("users.urls", namespace="users")),
     path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
@@ -0,0 +1,155 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from rest_framework import generics
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from materials.cache import acached_data, course_detail_key, lesson_list_key
+from materials.conditional import aconditional_response, alist_etag, course_validators, make_etag
+from materials.fieldsets import SparseFieldsViewMixin
+from materials.models import Course, Lesson
+from materials.paginators import MaterialsPaginator, aload_first_lessons
+from materials.serializers import CourseDetailSerializer, CourseSerializer, LessonSerializer
+from materials.views import CourseQuerysetMixin, CourseViewSet
+from users.permissions import IsModer, IsOwner
+from users.roles import ais_moderator
+
+
+class AsyncAPIViewMixin:
+    """
+    Асинхронный dispatch для представлений DRF под ASGI (config/asgi.py).
+    Чтение идет через async ORM, роль модератора определяется заранее асинхронно,
+    поэтому синхронные проверки прав не обращаются к БД.
+    Остальные методы передаются синхронному представлению write_view.
+    """
+
+    read_methods = ("GET", "HEAD", "OPTIONS")
+    write_view = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method not in self.read_methods and self.write_view is not None:
+            return await sync_to_async(self.write_view)(request, *args, **kwargs)
+
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        """Асинхронный вариант APIView.initial"""
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        request.accepted_renderer, request.accepted_media_type = self.perform_content_negotiation(request)
+        request.version, request.versioning_scheme = self.determine_version(request, *args, **kwargs)
+
+        await sync_to_async(self.perform_authentication)(request)
+        await ais_moderator(request)
+        self.check_permissions(request)
+        self.check_throttles(request)
+
+    async def aget_object(self):
+        """Асинхронный вариант GenericAPIView.get_object"""
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except queryset.model.DoesNotExist:
+            raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def alist(self):
+        """Асинхронный вариант ListModelMixin.list"""
+        queryset = self.filter_queryset(self.get_queryset())
+        page = await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class AsyncCourseListView(AsyncAPIViewMixin, CourseQuerysetMixin, generics.GenericAPIView):
+    """Асинхронный список курсов; создание курса выполняет CourseViewSet"""
+    action = "list"
+    serializer_class = CourseSerializer
+    queryset = Course.objects.all()
+    pagination_class = MaterialsPaginator
+    write_view = staticmethod(CourseViewSet.as_view({"post": "create"}, basename="courses", detail=False))
+
+    async def get(self, request, *args, **kwargs):
+        if self.paginator.use_cursor(request):
+            return await self.alist()
+        etag = await alist_etag(request, self.queryset, request.user.pk)
+        return await aconditional_response(request, self.alist, etag)
+
+
+class AsyncCourseDetailView(AsyncAPIViewMixin, CourseQuerysetMixin, generics.GenericAPIView):
+    """Асинхронное получение курса; изменение и удаление выполняет CourseViewSet"""
+    action = "retrieve"
+    serializer_class = CourseDetailSerializer
+    queryset = Course.objects.all()
+    permission_classes = (IsModer | IsOwner,)
+    write_view = staticmethod(CourseViewSet.as_view(
+        {"put": "update", "patch": "partial_update", "delete": "destroy"}, basename="courses", detail=True
+    ))
+
+    async def get(self, request, *args, **kwargs):
+        course = await self.aget_object()
+        serializer = self.get_serializer(course)
+
+        async def build():
+            if serializer.needs_lessons():
+                await aload_first_lessons(course, serializer.lesson_columns())
+            return serializer.data
+
+        async def respond():
+            key = await sync_to_async(course_detail_key)(course.pk, course.is_subscribed, serializer.fields)
+            return Response(await acached_data(key, build))
+
+        return await aconditional_response(request, respond, *course_validators(request, course))
+
+
+class AsyncLessonListView(AsyncAPIViewMixin, SparseFieldsViewMixin, generics.GenericAPIView):
+    """Асинхронный список уроков"""
+    serializer_class = LessonSerializer
+    queryset = Lesson.objects.all()
+    pagination_class = MaterialsPaginator
+
+    async def get(self, request, *args, **kwargs):
+        async def build():
+            return (await self.alist()).data
+
+        async def respond():
+            return Response(await acached_data(key, build))
+
+        key = await sync_to_async(lesson_list_key)(request)
+        return await aconditional_response(request, respond, make_etag(key))
+
+
+class AsyncLessonRetrieveView(AsyncAPIViewMixin, SparseFieldsViewMixin, generics.GenericAPIView):
+    """Асинхронное получение урока"""
+    serializer_class = LessonSerializer
+    queryset = Lesson.objects.all()
+    permission_classes = (IsAuthenticated, IsModer | IsOwner)
+    extra_columns = ("owner", "updated_at")
+
+    async def get(self, request, *args, **kwargs):
+        lesson = await self.aget_object()
+
+        async def respond():
+            return Response(self.get_serializer(lesson).data)
+
+        etag = make_etag(request.get_full_path(), lesson.updated_at)
+        return await aconditional_response(request, respond, etag, lesson.updated_at)
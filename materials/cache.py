@@ -0,0 +1,92 @@
+import asyncio
+import hashlib
+import time
+from uuid import uuid4
+
+from django.core.cache import cache
+
+from config.db_router import use_primary
+from config.locks import acache_lock, cache_lock
+from config.settings import RESPONSE_CACHE_REBUILD_TIMEOUT, RESPONSE_CACHE_TIMEOUT
+
+# Сколько ждать, пока другой процесс пересобирает ответ, прежде чем собрать его самостоятельно
+SINGLE_FLIGHT_WAIT = 2
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+
+
+def get_version(name):
+    """
+    Возвращает текущую версию набора данных.
+    Версия - случайная строка, поэтому после вытеснения ключа старые записи не оживут.
+    """
+    key = f"materials:version:{name}"
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(*names):
+    """Делает устаревшими все закэшированные ответы, построенные на старой версии"""
+    cache.set_many({f"materials:version:{name}": uuid4().hex for name in names}, None)
+
+
+def course_detail_key(course_id, is_subscribed, fields):
+    """Ключ ответа с информацией о курсе: версия курса, подписка зрителя и набор полей ответа"""
+    fieldset = hashlib.md5(",".join(sorted(fields)).encode()).hexdigest()
+    return f"materials:course:{course_id}:{get_version(f'course:{course_id}')}:{int(is_subscribed)}:{fieldset}"
+
+
+def lesson_list_key(request):
+    """Ключ страницы списка уроков: версия уроков и полный адрес запроса"""
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f"materials:lessons:{get_version('lessons')}:{url}"
+
+
+def cached_data(key, build):
+    """
+    Возвращает данные из кэша или собирает их функцией build.
+    Пересборку выполняет только один процесс, остальные ждут готовый результат.
+    Данные для кэша читаются из основной БД: иначе отставание реплики сохранилось бы в кэше до его истечения.
+    """
+    data = cache.get(key)
+    if data is not None:
+        return data
+
+    with cache_lock(key, RESPONSE_CACHE_REBUILD_TIMEOUT) as acquired:
+        if acquired:
+            with use_primary():
+                data = build()
+            cache.set(key, data, RESPONSE_CACHE_TIMEOUT)
+            return data
+
+    deadline = time.monotonic() + SINGLE_FLIGHT_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+        data = cache.get(key)
+        if data is not None:
+            return data
+    return build()
+
+
+async def acached_data(key, build):
+    """Асинхронный вариант cached_data: build - корутинная функция"""
+    data = await cache.aget(key)
+    if data is not None:
+        return data
+
+    async with acache_lock(key, RESPONSE_CACHE_REBUILD_TIMEOUT) as acquired:
+        if acquired:
+            with use_primary():
+                data = await build()
+            await cache.aset(key, data, RESPONSE_CACHE_TIMEOUT)
+            return data
+
+    deadline = time.monotonic() + SINGLE_FLIGHT_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+        data = await cache.aget(key)
+        if data is not None:
+            return data
+    return await build()
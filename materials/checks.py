@@ -0,0 +1,20 @@
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Версии закэшированных ответов, отзыв токенов и блокировки работают через кэш и должны быть общими
+    для всех процессов и воркеров Celery; локальный кэш процесса годится только для разработки и тестов
+    """
+    if not isinstance(caches["default"], LocMemCache):
+        return []
+    return [
+        Warning(
+            "Кэш не общий: сброс закэшированных ответов, отзыв токенов и блокировки действуют только внутри процесса",
+            hint="Укажите CACHE_LOCATION, например redis://redis:6379/1",
+            id="materials.W001",
+        )
+    ]
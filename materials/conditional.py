@@ -0,0 +1,74 @@
+import hashlib
+
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from materials.models import Lesson
+
+# Версия списка: время последнего изменения и число объектов (удаление меняет число)
+LIST_VERSION = {"updated_at": Max("updated_at"), "count": Count("pk")}
+
+
+def make_etag(*parts):
+    """ETag — хеш от всего, от чего зависит содержимое ответа"""
+    return quote_etag(hashlib.md5(":".join(map(str, parts)).encode()).hexdigest())
+
+
+def list_etag(request, queryset, *parts):
+    """
+    ETag страницы списка одним агрегатным запросом, без выборки и сериализации строк.
+    Last-Modified для списков не отдается: удаление объекта не меняет время последнего изменения.
+    """
+    version = queryset.order_by().aggregate(**LIST_VERSION)
+    return make_etag(request.get_full_path(), *parts, version["updated_at"], version["count"])
+
+
+async def alist_etag(request, queryset, *parts):
+    """Асинхронный вариант list_etag"""
+    version = await queryset.order_by().aaggregate(**LIST_VERSION)
+    return make_etag(request.get_full_path(), *parts, version["updated_at"], version["count"])
+
+
+def lessons_updated_at():
+    """Подзапрос со временем последнего изменения уроков курса: уроки входят в ответ с курсом"""
+    return Subquery(
+        Lesson.objects.filter(course=OuterRef("pk")).order_by().values("course").annotate(last=Max("updated_at"))
+        .values("last")
+    )
+
+
+def course_validators(request, course):
+    """ETag и Last-Modified курса с аннотациями is_subscribed и lessons_updated_at"""
+    last_modified = max(filter(None, (course.updated_at, course.lessons_updated_at)))
+    etag = make_etag(request.get_full_path(), course.is_subscribed, course.updated_at, course.lessons_updated_at)
+    return etag, last_modified
+
+
+def not_modified(request, etag, last_modified=None):
+    """Ответ 304 без тела, если версия у клиента актуальна (If-None-Match / If-Modified-Since), иначе None"""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, etag, last_modified=None):
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    return response
+
+
+def conditional_response(request, build, etag, last_modified=None):
+    """Отвечает 304, если данные у клиента не изменились, иначе ответом build()"""
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        response = build()
+    return set_validators(response, etag, last_modified)
+
+
+async def aconditional_response(request, build, etag, last_modified=None):
+    """Асинхронный вариант conditional_response: build — корутинная функция"""
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        response = await build()
+    return set_validators(response, etag, last_modified)
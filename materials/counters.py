@@ -0,0 +1,96 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Now
+
+from materials.models import Course, Lesson, Subscription
+
+# Размер пачки курсов при сверке счетчиков
+RECOUNT_BATCH_SIZE = 1000
+
+COUNTED = {
+    "lessons_count": Lesson,
+    "subscribers_count": Subscription,
+}
+
+
+# Накопленные изменения счетчиков внутри batched_counters(): {field: Counter({course_id: изменение})}
+_pending = ContextVar("pending_counters", default=None)
+
+
+@contextmanager
+def batched_counters():
+    """
+    Изменения счетчиков внутри блока (например, из сигналов при удалении многих объектов)
+    накапливаются и записываются при выходе — одним UPDATE на каждое значение изменения.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+    pending = defaultdict(Counter)
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    for field, deltas in pending.items():
+        change_counters(field, deltas)
+
+
+def change_counters(field, deltas):
+    """
+    Сдвигает счетчик field на курсах через F(): deltas — {course_id: изменение}.
+    Курсы с одинаковым изменением обновляются одним UPDATE; счетчик не опускается ниже нуля.
+    """
+    pending = _pending.get()
+    if pending is not None:
+        pending[field].update(deltas)
+        return
+    by_delta = defaultdict(list)
+    for course_id, delta in Counter(deltas).items():
+        if course_id is not None and delta:
+            by_delta[delta].append(course_id)
+    for delta, course_ids in by_delta.items():
+        value = F(field) + delta if delta > 0 else Greatest(F(field) + delta, 0)
+        Course.objects.filter(pk__in=course_ids).update(**{field: value}, updated_at=Now())
+
+
+def actual_count(field):
+    """Подзапрос с настоящим количеством уроков или подписчиков курса"""
+    counted = (
+        COUNTED[field].objects.filter(course=OuterRef("pk"))
+        .order_by()
+        .values("course")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def recount_courses():
+    """Исправляет разошедшиеся счетчики всех курсов и возвращает количество исправленных курсов"""
+    drifted = (
+        Course.objects.annotate(**{f"actual_{field}": actual_count(field) for field in COUNTED})
+        .exclude(**{field: F(f"actual_{field}") for field in COUNTED})
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+    fixed = 0
+    batch = []
+    for course_id in drifted.iterator(chunk_size=RECOUNT_BATCH_SIZE):
+        batch.append(course_id)
+        if len(batch) == RECOUNT_BATCH_SIZE:
+            fixed += recount(batch)
+            batch = []
+    return fixed + recount(batch)
+
+
+def recount(course_ids):
+    """Записывает настоящие значения счетчиков перечисленных курсов"""
+    if not course_ids:
+        return 0
+    return Course.objects.filter(pk__in=course_ids).update(
+        **{field: actual_count(field) for field in COUNTED}, updated_at=Now()
+    )
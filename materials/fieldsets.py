@@ -0,0 +1,67 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_QUERY_PARAM = "fields"
+OMIT_QUERY_PARAM = "omit"
+
+
+def requested_names(request, param):
+    """Имена полей из параметра ?fields=a,b; None, если параметр не передан"""
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(",") if name.strip()}
+
+
+def select_fields(fields, request):
+    """Оставляет поля из ?fields= и убирает поля из ?omit=; неизвестное имя поля — ошибка 400"""
+    selected = requested_names(request, FIELDS_QUERY_PARAM)
+    omitted = requested_names(request, OMIT_QUERY_PARAM) or set()
+    for param, names in ((FIELDS_QUERY_PARAM, selected or set()), (OMIT_QUERY_PARAM, omitted)):
+        unknown = names - set(fields)
+        if unknown:
+            raise ValidationError({param: f"Неизвестные поля: {', '.join(sorted(unknown))}"})
+    for name in list(fields):
+        if (selected is not None and name not in selected) or name in omitted:
+            del fields[name]
+    return fields
+
+
+class SparseFieldsMixin:
+    """Сериализатор отдает только поля, выбранные параметрами ?fields= и ?omit= запроса на чтение"""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get("request")
+        # Параметры относятся к корневому сериализатору (или элементу корневого списка), а не к вложенным
+        if request is None or request.method not in SAFE_METHODS or self.root not in (self, self.parent):
+            return fields
+        return select_fields(fields, request)
+
+
+def model_columns(serializer):
+    """
+    Столбцы модели, которые читают поля сериализатора. Поле может перечислить их в model_fields
+    (например, варианты изображения читают и само изображение); аннотации и связи в список не входят.
+    """
+    opts = serializer.Meta.model._meta
+    concrete = {field.name for field in opts.concrete_fields}
+    columns = {opts.pk.name}
+    for field in serializer.fields.values():
+        names = getattr(field, "model_fields", None) or [field.source.split(".")[0]]
+        columns.update(name for name in names if name in concrete)
+    return columns
+
+
+class SparseFieldsViewMixin:
+    """
+    Выборка из БД сужается через .only() до столбцов, которые нужны выбранным полям сериализатора.
+    extra_columns — столбцы, которые читают проверки прав (например, владелец объекта).
+    """
+    extra_columns = ()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        return queryset.only(*model_columns(self.get_serializer()), *self.extra_columns)
@@ -0,0 +1,130 @@
+import hashlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.validators import FileExtensionValidator
+from django.db import transaction
+from django.db.models.signals import post_init, post_save
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+from config.settings import IMAGE_VARIANT_FORMATS, IMAGE_VARIANT_QUALITY, IMAGE_VARIANT_SIZES
+
+IMAGE_EXTENSIONS = ("jpg", "jpeg", "png", "gif", "webp", "bmp")
+VARIANTS_DIR = "variants"
+
+
+def variants_field(field):
+    """Имя JSON-поля с вариантами изображения: preview -> preview_variants"""
+    return f"{field}_variants"
+
+
+def render_variant(image, size, image_format):
+    """Уменьшает изображение до size по длинной стороне (без увеличения) и кодирует в нужный формат"""
+    image = image.copy()
+    image.thumbnail((size, size))
+    if image_format == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, format=image_format.upper(), quality=IMAGE_VARIANT_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def build_variants(field_file):
+    """
+    Создает уменьшенные копии изображения во всех форматах и возвращает их имена в хранилище.
+    Имя файла — хеш содержимого, поэтому файл можно кэшировать навсегда, а повторная обработка
+    того же изображения ничего не записывает.
+    """
+    storage = field_file.storage
+    with field_file.open("rb") as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    variants = {"source": field_file.name}
+    for label, size in IMAGE_VARIANT_SIZES.items():
+        variants[label] = {}
+        for image_format in IMAGE_VARIANT_FORMATS:
+            content = render_variant(image, size, image_format)
+            extension = "jpg" if image_format == "jpeg" else image_format
+            name = f"{VARIANTS_DIR}/{hashlib.sha256(content).hexdigest()}.{extension}"
+            if not storage.exists(name):
+                name = storage.save(name, ContentFile(content))
+            variants[label][image_format] = name
+    return variants
+
+
+def watch_image_field(model, field):
+    """
+    После сохранения нового изображения ставит в очередь задачу, которая создаст его варианты.
+    Сам запрос изображение не открывает; при удалении изображения варианты очищаются сразу.
+    """
+    loaded = f"_loaded_{field}"
+
+    def remember_image(sender, instance, **kwargs):
+        value = instance.__dict__.get(field)
+        instance.__dict__[loaded] = getattr(value, "name", value)
+
+    def schedule_variants(sender, instance, update_fields=None, **kwargs):
+        if field not in instance.__dict__ or (update_fields is not None and field not in update_fields):
+            return
+        name = getattr(instance, field).name or None
+        if name == (instance.__dict__.get(loaded) or None):
+            return
+        instance.__dict__[loaded] = name
+        if name is None:
+            model.objects.filter(pk=instance.pk).update(**{variants_field(field): {}})
+            return
+
+        from materials.tasks import generate_image_variants
+        label, pk = model._meta.label, instance.pk
+        transaction.on_commit(lambda: generate_image_variants.delay(label, pk, field))
+
+    post_init.connect(remember_image, sender=model, weak=False, dispatch_uid=f"remember_{field}_{model._meta.label}")
+    post_save.connect(schedule_variants, sender=model, weak=False, dispatch_uid=f"variants_{field}_{model._meta.label}")
+
+
+class ImageUploadField(serializers.FileField):
+    """
+    Загрузка изображения без декодирования в запросе: проверяется только расширение,
+    само изображение открывает фоновая задача генерации вариантов.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("validators", [FileExtensionValidator(IMAGE_EXTENSIONS)])
+        super().__init__(**kwargs)
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    Ссылки на варианты изображения: {"small": {"webp": url, "jpeg": url}, ...}.
+    Пока варианты текущего изображения не готовы, возвращает None.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    @property
+    def model_fields(self):
+        """Столбцы модели, которые читает поле (см. materials.fieldsets.model_columns)"""
+        return [self.image_field, variants_field(self.image_field)]
+
+    def to_representation(self, instance):
+        image = getattr(instance, self.image_field)
+        variants = getattr(instance, variants_field(self.image_field)) or {}
+        if not image or variants.get("source") != image.name:
+            return None
+        request = self.context.get("request")
+        storage = image.storage
+        urls = {}
+        for label, formats in variants.items():
+            if label == "source":
+                continue
+            urls[label] = {}
+            for image_format, name in formats.items():
+                url = storage.url(name)
+                urls[label][image_format] = request.build_absolute_uri(url) if request is not None else url
+        return urls
@@ -0,0 +1,357 @@
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from decimal import Decimal
+from itertools import count
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.shortcuts import reverse
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from config.celery import app
+from config.settings import BASE_DIR
+from materials import urls as materials_urls
+from materials.models import Course, Lesson, Subscription
+from users import urls as users_urls
+from users.models import Payment, User
+from users.rollups import rebuild_rollups
+
+DEFAULT_BUDGETS = BASE_DIR / "benchmarks" / "budgets.json"
+
+# Число запросов и память воспроизводимы и проверяются всегда. Задержка зависит от машины: p95 сверяется
+# с бюджетом по флагу --check-latency и с допуском LATENCY_TOLERANCE
+BUDGET_METRICS = ("queries", "peak_kb")
+LATENCY_METRIC = "p95_ms"
+LATENCY_TOLERANCE = 2
+
+# Запас, который --update-budgets закладывает к измеренным задержке и памяти:
+# множитель и абсолютная добавка, чтобы единичные паузы GC не роняли быстрые маршруты
+LATENCY_HEADROOM = 3
+LATENCY_SLACK_MS = 20
+MEMORY_HEADROOM = 2
+MEMORY_SLACK_KB = 256
+
+PASSWORD = "benchmark"
+
+
+class Scenario:
+    """Запрос к маршруту: url и data собираются функциями от засеянных данных"""
+
+    def __init__(self, route, method="get", url=None, data=None, user="owner", postgres_only=False):
+        self.route = route
+        self.method = method
+        self.url = url or (lambda ctx: reverse(route))
+        self.data = data or (lambda ctx: None)
+        self.user = user
+        self.postgres_only = postgres_only
+
+    @property
+    def name(self):
+        return f"{self.route} {self.method.upper()}"
+
+
+def lesson_payload(ctx, title):
+    return {
+        "title": title,
+        "description": "Описание урока",
+        "video_url": "https://www.youtube.com/watch",
+        "course": ctx["course"].pk,
+    }
+
+
+def new_lesson_url(ctx, route):
+    lesson = Lesson.objects.create(title="Удаляемый урок", description="", course=ctx["course"], owner=ctx["owner"])
+    return reverse(route, args=(lesson.pk,))
+
+
+SCENARIOS = [
+    Scenario("materials:api-root"),
+    Scenario("materials:courses-list"),
+    Scenario("materials:courses-list", "post", data=lambda ctx: {"title": "Новый курс", "description": "Описание"}),
+    Scenario("materials:courses-detail", url=lambda ctx: reverse("materials:courses-detail", args=(ctx["course"].pk,))),
+    Scenario(
+        "materials:courses-detail", "patch",
+        url=lambda ctx: reverse("materials:courses-detail", args=(ctx["course"].pk,)),
+        data=lambda ctx: {"title": f"Курс {next(ctx['counter'])}"},
+    ),
+    Scenario("materials:course_lessons", url=lambda ctx: reverse("materials:course_lessons", args=(ctx["course"].pk,))),
+    Scenario("materials:courses-search", data=lambda ctx: {"q": "курс"}, postgres_only=True),
+    Scenario("materials:lesson_list"),
+    Scenario("materials:lesson_search", data=lambda ctx: {"q": "урок"}, postgres_only=True),
+    Scenario("materials:lesson_get", url=lambda ctx: reverse("materials:lesson_get", args=(ctx["lesson"].pk,))),
+    Scenario("materials:lesson_create", "post", data=lambda ctx: lesson_payload(ctx, "Новый урок")),
+    Scenario(
+        "materials:lesson_update", "patch",
+        url=lambda ctx: reverse("materials:lesson_update", args=(ctx["lesson"].pk,)),
+        data=lambda ctx: {"title": f"Урок {next(ctx['counter'])}"},
+    ),
+    Scenario("materials:lesson_delete", "delete", url=lambda ctx: new_lesson_url(ctx, "materials:lesson_delete")),
+    Scenario(
+        "materials:lesson_bulk", "post",
+        data=lambda ctx: [lesson_payload(ctx, f"Импорт {i}") for i in range(100)],
+    ),
+    Scenario(
+        "materials:subscribe_view", "post",
+        url=lambda ctx: reverse("materials:subscribe_view", args=(ctx["course"].pk,)),
+    ),
+    Scenario(
+        "materials:subscribe_bulk", "post",
+        data=lambda ctx: {"courses": ctx["course_ids"], "subscribe": next(ctx["counter"]) % 2 == 0},
+    ),
+    Scenario("users:payment_list"),
+    Scenario(
+        "users:payment_create", "post",
+        url=lambda ctx: reverse("users:payment_create", args=(ctx["course"].pk,)),
+        data=lambda ctx: {"payment_amount": "1000.00"},
+    ),
+    Scenario("users:payment_status", url=lambda ctx: reverse("users:payment_status", args=(ctx["payment"].pk,))),
+    Scenario("users:payment_report", data=lambda ctx: {"group_by": "course"}, user="admin"),
+    Scenario("users:payment_export", data=lambda ctx: {"file_format": "csv"}, user="admin"),
+    Scenario(
+        "users:register", "post",
+        data=lambda ctx: {"email": f"new{next(ctx['counter'])}@bench.local", "password": PASSWORD},
+    ),
+    Scenario("users:login", "post", user=None, data=lambda ctx: {"email": ctx["owner"].email, "password": PASSWORD}),
+    Scenario("users:token_refresh", "post", user=None, data=lambda ctx: {"refresh": ctx["refresh"]}),
+]
+
+
+def route_names():
+    """Имена всех маршрутов materials.urls и users.urls"""
+    return {
+        f"{module.app_name}:{pattern.name}"
+        for module in (materials_urls, users_urls)
+        for pattern in module.urlpatterns
+        if pattern.name
+    }
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу"""
+    values = sorted(values)
+    return values[max(0, round(percent / 100 * len(values)) - 1)]
+
+
+def check_budgets(results, budgets, check_latency=False):
+    """
+    Возвращает список превышений бюджета: число запросов и пиковая память, а с check_latency —
+    p95 задержки сверх бюджета, умноженного на LATENCY_TOLERANCE
+    """
+    violations = []
+    for name, result in results.items():
+        budget = budgets.get(name)
+        if budget is None:
+            violations.append(f"{name}: нет бюджета")
+            continue
+        limits = {metric: budget[metric] for metric in BUDGET_METRICS}
+        if check_latency:
+            limits[LATENCY_METRIC] = round(budget[LATENCY_METRIC] * LATENCY_TOLERANCE, 1)
+        for metric, limit in limits.items():
+            if result[metric] > limit:
+                violations.append(f"{name}: {metric} {result[metric]} > {limit}")
+    return violations
+
+
+def updated_budget(budget, result):
+    """
+    Бюджет маршрута после --update-budgets. Число запросов записывается как измерено, задержка и память
+    пересчитываются только при превышении или отсутствии бюджета: иначе каждый прогон менял бы
+    файл по всем маршрутам, а не только по тем, которые затронуло изменение.
+    """
+    budget = budget or {}
+    p95_ms = budget.get(LATENCY_METRIC)
+    if p95_ms is None or result[LATENCY_METRIC] > p95_ms:
+        p95_ms = round(result[LATENCY_METRIC] * LATENCY_HEADROOM + LATENCY_SLACK_MS, 1)
+    peak_kb = budget.get("peak_kb")
+    if peak_kb is None or result["peak_kb"] > peak_kb:
+        peak_kb = round(result["peak_kb"] * MEMORY_HEADROOM + MEMORY_SLACK_KB)
+    return {"queries": result["queries"], LATENCY_METRIC: p95_ms, "peak_kb": peak_kb}
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный прогон всех маршрутов materials и users на тестовой БД с реалистичным объемом данных. "
+        "Измеряет число SQL-запросов, p50/p95 задержки и пиковую память и сверяет их с бюджетом"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--courses", type=int, default=200)
+        parser.add_argument("--lessons-per-course", type=int, default=20)
+        parser.add_argument("--subscriptions-per-user", type=int, default=5)
+        parser.add_argument("--payments", type=int, default=5000)
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--budgets", default=str(DEFAULT_BUDGETS), help="Файл бюджета в формате JSON")
+        parser.add_argument("--update-budgets", action="store_true", help="Записать измерения в файл бюджета")
+        parser.add_argument(
+            "--check-latency", action="store_true",
+            help=f"Сверять и p95 задержки (с допуском x{LATENCY_TOLERANCE}); без флага задержка только выводится",
+        )
+
+    def handle(self, *args, **options):
+        missing = route_names() - {scenario.route for scenario in SCENARIOS}
+        if missing:
+            raise CommandError(f"Нет сценариев для маршрутов: {', '.join(sorted(missing))}")
+
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        databases = runner.setup_databases()
+        always_eager = app.conf.task_always_eager
+        # Задачи Celery выполняются в процессе, чтобы их запросы попали в замер
+        app.conf.task_always_eager = True
+        try:
+            # Быстрый хешер паролей и Stripe без сети
+            with override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"]), \
+                    mock.patch("users.services.STRIPE_CLIENT", "users.services.FakeStripeClient"):
+                ctx = self.seed(options)
+                results = {
+                    scenario.name: self.measure(scenario, ctx, options["iterations"])
+                    for scenario in SCENARIOS
+                    # Полнотекстовый поиск работает только на Postgres
+                    if connection.vendor == "postgresql" or not scenario.postgres_only
+                }
+        finally:
+            app.conf.task_always_eager = always_eager
+            runner.teardown_databases(databases)
+            runner.teardown_test_environment()
+
+        self.report(results)
+
+        if options["update_budgets"]:
+            # Бюджеты маршрутов, не измеренных в этом прогоне (например, поиска без Postgres), сохраняются
+            budgets = self.load_budgets(options["budgets"]) if os.path.exists(options["budgets"]) else {}
+            budgets |= {name: updated_budget(budgets.get(name), result) for name, result in results.items()}
+            with open(options["budgets"], "w", encoding="utf-8") as file:
+                json.dump(budgets, file, ensure_ascii=False, indent=2, sort_keys=True)
+                file.write("\n")
+            self.stdout.write(self.style.SUCCESS(f"Бюджет записан в {options['budgets']}"))
+            return
+
+        violations = check_budgets(results, self.load_budgets(options["budgets"]), options["check_latency"])
+        if violations:
+            raise CommandError("Превышен бюджет:\n" + "\n".join(violations))
+        self.stdout.write(self.style.SUCCESS("Все маршруты укладываются в бюджет"))
+
+    def load_budgets(self, path):
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+
+    def seed(self, options):
+        """Заполняет тестовую БД курсами, уроками, подписками и платежами"""
+        rnd = random.Random(options["seed"])
+        password = make_password(PASSWORD)
+
+        users = User.objects.bulk_create(
+            User(email=f"user{i}@bench.local", password=password, is_active=True) for i in range(options["users"])
+        )
+        owner = users[0]
+        admin = User.objects.create(email="admin@bench.local", password=password, is_staff=True)
+
+        courses = Course.objects.bulk_create(
+            Course(title=f"Курс {i}", description="Описание курса " * 20, owner=rnd.choice(users[:50]))
+            for i in range(options["courses"])
+        )
+        courses[0].owner = owner
+        courses[0].save()
+        Lesson.objects.bulk_create(
+            (
+                Lesson(
+                    title=f"Урок {i}",
+                    description="Описание урока " * 50,
+                    video_url="https://www.youtube.com/watch",
+                    course=course,
+                    owner=course.owner,
+                )
+                for course in courses
+                for i in range(options["lessons_per_course"])
+            ),
+            batch_size=1000,
+        )
+        Subscription.objects.bulk_create(
+            (
+                Subscription(user=user, course=course)
+                for user in users
+                for course in rnd.sample(courses, min(options["subscriptions_per_user"], len(courses)))
+            ),
+            batch_size=1000,
+        )
+        payments = Payment.objects.bulk_create(
+            (
+                Payment(
+                    user=owner if i == 0 else rnd.choice(users),
+                    paid_course=rnd.choice(courses),
+                    payment_amount=Decimal(rnd.randint(100, 10000)),
+                    payment_method=rnd.choice(["cash", "transfer"]),
+                    status=Payment.STATUS_READY,
+                )
+                for i in range(options["payments"])
+            ),
+            batch_size=1000,
+        )
+        rebuild_rollups()
+
+        client = APIClient()
+        refresh = client.post(reverse("users:login"), {"email": owner.email, "password": PASSWORD}).json()["refresh"]
+        return {
+            "owner": owner,
+            "admin": admin,
+            "course": courses[0],
+            "course_ids": [course.pk for course in courses[:100]],
+            "lesson": Lesson.objects.filter(course=courses[0]).first(),
+            "payment": payments[0],
+            "refresh": refresh,
+            "counter": count(),
+        }
+
+    def measure(self, scenario, ctx, iterations):
+        """Выполняет сценарий и возвращает число запросов, p50/p95 задержки и пиковую память"""
+        client = APIClient()
+        if scenario.user:
+            client.force_authenticate(user=ctx[scenario.user])
+        cache.clear()
+
+        def request():
+            url, data = scenario.url(ctx), scenario.data(ctx)
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(client, scenario.method)(url, data, format="json")
+                if response.streaming:
+                    # Потоковый ответ читается целиком, но без накопления в памяти
+                    for _ in response.streaming_content:
+                        pass
+            elapsed = (time.perf_counter() - start) * 1000
+            if response.status_code >= 400:
+                raise CommandError(f"{scenario.name}: ответ {response.status_code} {response.content[:200]}")
+            return len(queries), elapsed
+
+        measurements = [request() for _ in range(iterations)]
+        durations = [elapsed for _, elapsed in measurements]
+
+        tracemalloc.start()
+        request()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            "queries": max(queries for queries, _ in measurements),
+            "p50_ms": round(statistics.median(durations), 1),
+            "p95_ms": round(percentile(durations, 95), 1),
+            "peak_kb": round(peak / 1024),
+        }
+
+    def report(self, results):
+        self.stdout.write(f"{'Маршрут':<40} {'запросы':>8} {'p50, мс':>9} {'p95, мс':>9} {'память, КБ':>11}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<40} {result['queries']:>8} {result['p50_ms']:>9} {result['p95_ms']:>9} {result['peak_kb']:>11}"
+            )
@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from materials.counters import recount_courses
+
+
+class Command(BaseCommand):
+    help = "Сверяет lessons_count и subscribers_count курсов с уроками и подписками и исправляет расхождения"
+
+    def handle(self, *args, **kwargs):
+        fixed = recount_courses()
+        self.stdout.write(self.style.SUCCESS(f"Исправлено курсов: {fixed}"))
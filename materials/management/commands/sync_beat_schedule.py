@@ -0,0 +1,35 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django_celery_beat.models import PeriodicTask, PeriodicTasks
+from django_celery_beat.schedulers import ModelEntry
+
+from config.celery import app
+from config.settings import CELERY_BEAT_SCHEDULE
+
+
+class Command(BaseCommand):
+    help = "Переносит CELERY_BEAT_SCHEDULE в расписание django_celery_beat в БД"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--disable-missing", action="store_true",
+            help="Отключить периодические задачи из БД, которых нет в CELERY_BEAT_SCHEDULE",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        for name, entry in CELERY_BEAT_SCHEDULE.items():
+            ModelEntry.from_entry(name, app=app, **entry)
+        self.stdout.write(f"Задач в расписании: {len(CELERY_BEAT_SCHEDULE)}")
+
+        if options["disable_missing"]:
+            # Служебные задачи celery.* создает сам планировщик
+            disabled = (
+                PeriodicTask.objects.filter(enabled=True)
+                .exclude(name__in=CELERY_BEAT_SCHEDULE)
+                .exclude(task__startswith="celery.")
+                .update(enabled=False)
+            )
+            # UPDATE без сигналов: планировщику нужно явно сообщить об изменении расписания
+            PeriodicTasks.update_changed()
+            self.stdout.write(f"Отключено задач: {disabled}")
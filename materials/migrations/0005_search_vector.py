@@ -0,0 +1,55 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:39
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+def fill_search_vectors(apps, schema_editor):
+    """Заполняет поисковые векторы существующих курсов и уроков до создания GIN-индексов"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for model_name in ("Course", "Lesson"):
+        apps.get_model("materials", model_name).objects.update(
+            search_vector=django.contrib.postgres.search.SearchVector("title", weight="A", config="russian")
+            + django.contrib.postgres.search.SearchVector("description", weight="B", config="russian")
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0004_subscription"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True, verbose_name="Поисковый вектор"
+            ),
+        ),
+        migrations.AddField(
+            model_name="lesson",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True, verbose_name="Поисковый вектор"
+            ),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="course",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="materials_course_search_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="lesson",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="materials_lesson_search_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:45
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    """Заполняет счетчики существующих курсов одним UPDATE"""
+    Course = apps.get_model("materials", "Course")
+
+    def count(model_name):
+        counted = (
+            apps.get_model("materials", model_name).objects.filter(course=models.OuterRef("pk"))
+            .order_by()
+            .values("course")
+            .annotate(total=models.Count("pk"))
+            .values("total")
+        )
+        return Coalesce(models.Subquery(counted, output_field=models.IntegerField()), models.Value(0))
+
+    Course.objects.update(lessons_count=count("Lesson"), subscribers_count=count("Subscription"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0005_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="lessons_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Количество уроков"
+            ),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="subscribers_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Количество подписчиков"
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0006_course_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="preview_variants",
+            field=models.JSONField(
+                blank=True, default=dict, editable=False, verbose_name="Варианты превью"
+            ),
+        ),
+        migrations.AddField(
+            model_name="lesson",
+            name="preview_variants",
+            field=models.JSONField(
+                blank=True, default=dict, editable=False, verbose_name="Варианты превью"
+            ),
+        ),
+    ]
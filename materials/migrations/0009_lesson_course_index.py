@@ -0,0 +1,35 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0008_updated_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # Составной индекс создается до удаления индекса по course_id, чтобы уроки курса не остались без индекса
+    operations = [
+        migrations.AddIndex(
+            model_name="lesson",
+            index=models.Index(
+                fields=["course", "id"], name="materials_lesson_course_idx"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="lesson",
+            name="course",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="lessons",
+                to="materials.course",
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:34
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0009_lesson_course_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="course",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                db_default=django.db.models.functions.datetime.Now(),
+                verbose_name="Дата изменения",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="lesson",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                db_default=django.db.models.functions.datetime.Now(),
+                verbose_name="Дата изменения",
+            ),
+        ),
+    ]
@@ -1,4 +1,7 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.functions import Now
 
 NULLABLE = {"null": True, "blank": True}
 
@@ -6,8 +9,15 @@ NULLABLE = {"null": True, "blank": True}
 class Course(models.Model):
     title = models.CharField(max_length=150, verbose_name="Название курса")
     preview = models.ImageField(upload_to="courses/", **NULLABLE, verbose_name="Превью курса")
+    preview_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Варианты превью")
     description = models.TextField(verbose_name="Описания курса")
     owner = models.ForeignKey("users.User", on_delete=models.SET_NULL, **NULLABLE, verbose_name="Владелец")
+    search_vector = SearchVectorField(null=True, editable=False, verbose_name="Поисковый вектор")
+    # Счетчики обновляются через F() при записи уроков и подписок, сверка: manage.py recount_course_counters
+    lessons_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество уроков")
+    subscribers_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество подписчиков")
+    # Версия для ETag и Last-Modified; меняется и при обновлении счетчиков
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now(), verbose_name="Дата изменения")
 
     def __str__(self):
         return self.title
@@ -15,15 +25,20 @@ class Course(models.Model):
     class Meta:
         verbose_name = "Курс"
         verbose_name_plural = "Курсы"
+        indexes = [GinIndex(fields=["search_vector"], name="materials_course_search_idx")]
 
 
 class Lesson(models.Model):
-    course = models.ForeignKey(Course, on_delete=models.CASCADE, **NULLABLE, related_name="lessons")
+    # Отдельный индекс по course_id не нужен: его заменяет составной индекс (course, id)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, **NULLABLE, related_name="lessons", db_index=False)
     title = models.CharField(max_length=150, verbose_name="Название урока")
     description = models.TextField(verbose_name="Описание урока")
     preview = models.ImageField(upload_to="lessons/", **NULLABLE, verbose_name="Превью урока")
+    preview_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Варианты превью")
     video_url = models.URLField(**NULLABLE, verbose_name="Ссылка на видео урок")
     owner = models.ForeignKey("users.User", on_delete=models.SET_NULL, **NULLABLE, verbose_name="Владелец")
+    search_vector = SearchVectorField(null=True, editable=False, verbose_name="Поисковый вектор")
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now(), verbose_name="Дата изменения")
 
     def __str__(self):
         return self.title
@@ -31,6 +46,11 @@ class Lesson(models.Model):
     class Meta:
         verbose_name = "Урок"
         verbose_name_plural = "Уроки"
+        indexes = [
+            GinIndex(fields=["search_vector"], name="materials_lesson_search_idx"),
+            # Уроки курса по порядку id: первая страница в ответе курса и курсор /courses/<id>/lessons/
+            models.Index(fields=["course", "id"], name="materials_lesson_course_idx"),
+        ]
 
 
 class Subscription(models.Model):
@@ -1,7 +1,118 @@
-from rest_framework.pagination import PageNumberPagination
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from django.shortcuts import reverse
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, PageNumberPagination
+
+
+class MaterialsCursorPaginator(CursorPagination):
+    """Постраничный вывод по ключу (keyset): без COUNT(*) и OFFSET, с непрозрачными курсорами"""
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 15
+    ordering = "id"
 
 
 class MaterialsPaginator(PageNumberPagination):
+    """
+    Постраничный вывод по номеру страницы.
+    Режим курсоров включается параметром ?pagination=cursor
+    """
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 15
+
+    mode_query_param = "pagination"
+    cursor_mode = "cursor"
+    cursor_paginator_class = MaterialsCursorPaginator
+
+    cursor_paginator = None
+
+    def use_cursor(self, request):
+        """Проверяет, запрошен ли постраничный вывод по курсору"""
+        return (
+            request.query_params.get(self.mode_query_param) == self.cursor_mode
+            or self.cursor_paginator_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_paginator_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        self.cursor_paginator = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Асинхронный вариант paginate_queryset: COUNT и выборка страницы через async ORM"""
+        if self.use_cursor(request):
+            return await sync_to_async(self.paginate_queryset)(queryset, request, view)
+
+        self.cursor_paginator = None
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+        bottom = (number - 1) * page_size
+        object_list = [obj async for obj in queryset[bottom:bottom + page_size]]
+        self.page = paginator._get_page(object_list, number, paginator)
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return object_list
+
+
+class SearchPaginator(MaterialsPaginator):
+    """Результаты поиска выводятся только по номеру страницы: курсор по id потерял бы сортировку по релевантности"""
+
+    def use_cursor(self, request):
+        return False
+
+
+class CourseLessonsPaginator(MaterialsCursorPaginator):
+    """Уроки курса по курсору: WHERE course_id = ... AND id > ... ORDER BY id идет по индексу (course_id, id)"""
+
+
+def first_lessons_queryset(course, columns):
+    """
+    Первая страница уроков курса и один лишний урок, по которому видно, есть ли следующая.
+    columns — столбцы, которые нужны ответу (например, без search_vector)
+    """
+    return course.lessons.only(*columns).order_by("id")[:CourseLessonsPaginator.page_size + 1]
+
+
+def set_first_lessons(course, lessons):
+    """Запоминает на курсе первую страницу уроков для CourseDetailSerializer"""
+    course.first_lessons = lessons[:CourseLessonsPaginator.page_size]
+    course.has_more_lessons = len(lessons) > CourseLessonsPaginator.page_size
+
+
+def load_first_lessons(course, columns):
+    set_first_lessons(course, list(first_lessons_queryset(course, columns)))
+
+
+async def aload_first_lessons(course, columns):
+    set_first_lessons(course, [lesson async for lesson in first_lessons_queryset(course, columns)])
+
+
+def lessons_next_link(request, course):
+    """Ссылка на следующую страницу уроков курса после встроенной в ответ первой страницы"""
+    if not course.has_more_lessons:
+        return None
+    paginator = CourseLessonsPaginator()
+    url = reverse("materials:course_lessons", args=(course.pk,))
+    paginator.base_url = request.build_absolute_uri(url) if request is not None else url
+    return paginator.encode_cursor(Cursor(offset=0, reverse=False, position=str(course.first_lessons[-1].pk)))
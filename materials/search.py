@@ -0,0 +1,36 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F
+from rest_framework.exceptions import ValidationError
+
+from config.settings import SEARCH_CONFIG
+
+SEARCH_QUERY_PARAM = "q"
+# Поля, из которых собирается search_vector курсов и уроков
+SEARCH_FIELDS = ("title", "description")
+
+
+def search_document():
+    """Документ для tsvector: совпадения в названии весят больше, чем в описании"""
+    return (
+        SearchVector("title", weight="A", config=SEARCH_CONFIG)
+        + SearchVector("description", weight="B", config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(model, pks):
+    """Пересчитывает search_vector одним UPDATE (в т.ч. после bulk-операций без сигналов); только на Postgres"""
+    if connection.vendor != "postgresql" or not pks:
+        return
+    model.objects.filter(pk__in=pks).update(search_vector=search_document())
+
+
+def apply_search(queryset, request):
+    """Фильтрует queryset по запросу ?q= через GIN-индекс и сортирует по релевантности"""
+    text = request.query_params.get(SEARCH_QUERY_PARAM, "").strip()
+    if not text:
+        raise ValidationError({SEARCH_QUERY_PARAM: ["Укажите поисковый запрос"]})
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+    return queryset.filter(search_vector=query).annotate(
+        rank=SearchRank(F("search_vector"), query)
+    ).order_by("-rank", "id")
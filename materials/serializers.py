@@ -1,40 +1,197 @@
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 from materials.models import Course, Lesson, Subscription
+from materials.search import update_search_vectors
+from materials.counters import change_counters
+from materials.fieldsets import SparseFieldsMixin, model_columns
+from materials.paginators import lessons_next_link, load_first_lessons
+from materials.images import ImageUploadField, ImageVariantsField
+from materials.signals import invalidate_lessons, lesson_count_deltas
 from materials.validators import video_url_validator
 
+# Размер пачки для bulk_create / bulk_update
+BULK_BATCH_SIZE = 1000
+# Сколько курсов можно передать в массовую подписку
+BULK_SUBSCRIPTION_MAX_COURSES = 1000
 
-class LessonSerializer(serializers.ModelSerializer):
+
+class LessonBulkSerializer(serializers.ListSerializer):
+    """
+    Массовое создание и изменение уроков.
+    Элементы с id изменяют существующие уроки из context["lessons"], остальные создаются.
+    Ошибки возвращаются списком по каждому элементу.
+    """
+
+    def lesson_id(self, data):
+        """id урока из элемента запроса тем же полем, что и в уроке: "1" и 1 — один и тот же урок"""
+        lesson_id = data.get("id") if isinstance(data, dict) else None
+        if lesson_id is None:
+            return None
+        try:
+            return self.child.fields["id"].to_internal_value(lesson_id)
+        except serializers.ValidationError as exc:
+            raise serializers.ValidationError({"id": exc.detail})
+
+    def requested_ids(self, items):
+        """id уроков и курсов из запроса для предзагрузки; неверные значения покажет валидация элементов"""
+        lesson_ids, course_ids = [], []
+        for item in items:
+            try:
+                lesson_ids.append(self.lesson_id(item))
+            except serializers.ValidationError:
+                pass
+            try:
+                course_ids.append(self.child.fields["course"].course_id(item.get("course")))
+            except (TypeError, ValueError):
+                pass
+        return set(lesson_ids) - {None}, set(course_ids)
+
+    def run_child_validation(self, data):
+        lesson_id = self.lesson_id(data)
+        if lesson_id is None:
+            if not self.context.get("can_create", True):
+                raise serializers.ValidationError({"id": ["Модератор не может создавать уроки"]})
+            self.child.instance = None
+        else:
+            self.child.instance = self.context["lessons"].get(lesson_id)
+            if self.child.instance is None:
+                raise serializers.ValidationError({"id": [f"Урок {lesson_id} не найден"]})
+        self.child.initial_data = data
+        validated = super().run_child_validation(data)
+        return {**validated, "id": lesson_id}
+
+    @transaction.atomic
+    def save(self, **kwargs):
+        """Сохраняет уроки одним bulk_create и одним bulk_update; created — сколько уроков создано"""
+        lessons = self.context.get("lessons", {})
+        course_ids = {lesson.course_id for lesson in lessons.values()}
+        to_create, to_update, update_fields = [], [], set()
+        now = timezone.now()
+
+        self.instance = []
+        for attrs in self.validated_data:
+            lesson_id = attrs.pop("id")
+            if lesson_id is None:
+                # Владелец задается только представлением; у изменяемых уроков он не меняется
+                lesson = Lesson(**{**attrs, **kwargs})
+                to_create.append(lesson)
+            else:
+                lesson = lessons[lesson_id]
+                for field, value in attrs.items():
+                    setattr(lesson, field, value)
+                # bulk_update не выставляет auto_now
+                lesson.updated_at = now
+                update_fields.update(attrs, ["updated_at"])
+                to_update.append(lesson)
+            course_ids.add(lesson.course_id)
+            self.instance.append(lesson)
+
+        Lesson.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+        self.created = len(to_create)
+        if to_update:
+            Lesson.objects.bulk_update(to_update, sorted(update_fields), batch_size=BULK_BATCH_SIZE)
+        deltas = lesson_count_deltas(to_create, created=True)
+        deltas.update(lesson_count_deltas(to_update))
+        change_counters("lessons_count", deltas)
+        update_search_vectors(Lesson, [lesson.pk for lesson in self.instance])
+        invalidate_lessons(course_ids - {None})
+        return self.instance
+
+
+class PreloadedCourseField(serializers.PrimaryKeyRelatedField):
+    """Берет курс из context["courses"], если курсы загружены заранее, иначе запрашивает БД"""
+
+    @staticmethod
+    def course_id(data):
+        """id курса из запроса: число или строка с числом; иначе TypeError или ValueError"""
+        if isinstance(data, bool) or not isinstance(data, (int, str)):
+            raise TypeError(data)
+        return int(data)
+
+    def to_internal_value(self, data):
+        courses = self.context.get("courses")
+        if courses is None:
+            return super().to_internal_value(data)
+        try:
+            course = courses.get(self.course_id(data))
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if course is None:
+            self.fail("does_not_exist", pk_value=data)
+        return course
+
+
+class LessonSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     video_url = serializers.CharField(validators=[video_url_validator])
+    course = PreloadedCourseField(queryset=Course.objects.all(), allow_null=True, required=False)
+    preview = ImageUploadField(required=False, allow_null=True)
+    preview_variants = ImageVariantsField("preview")
 
     class Meta:
         model = Lesson
-        fields = "__all__"
+        exclude = ("search_vector", "updated_at")
+        # Владельца назначает представление: через API урок нельзя передать другому пользователю
+        read_only_fields = ("owner",)
+        list_serializer_class = LessonBulkSerializer
 
 
-class CourseSerializer(serializers.ModelSerializer):
-    lessons_count = serializers.SerializerMethodField()
+class CourseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     subscription = serializers.SerializerMethodField()
+    preview = ImageUploadField(required=False, allow_null=True)
+    preview_variants = ImageVariantsField("preview")
 
     def get_subscription(self, obj):
+        # Значение уже посчитано в запросе CourseViewSet.get_queryset
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         user = self.context["request"].user
         return Subscription.objects.filter(user=user, course=obj).exists()
 
-    def get_lessons_count(self, course):
-        return course.lessons.count()
-
     class Meta:
         model = Course
-        fields = ("id", "title", "lessons_count", "subscription")
+        fields = ("id", "title", "preview", "preview_variants", "lessons_count", "subscribers_count", "subscription")
+
 
+class CourseDetailSerializer(CourseSerializer):
+    """Курс с первой страницей уроков; остальные уроки — по ссылке lessons_next"""
+    lessons = LessonSerializer(source="first_lessons", many=True, read_only=True)
+    lessons_next = serializers.SerializerMethodField()
 
-class CourseDetailSerializer(serializers.ModelSerializer):
-    lessons_count = serializers.SerializerMethodField()
-    lessons = LessonSerializer(many=True, read_only=True)
+    def get_lessons_next(self, obj):
+        return lessons_next_link(self.context.get("request"), obj)
 
-    def get_lessons_count(self, course):
-        return course.lessons.count()
+    def needs_lessons(self):
+        """Первая страница уроков нужна, только если в ответе есть уроки или ссылка на следующую страницу"""
+        return bool({"lessons", "lessons_next"} & set(self.fields))
+
+    def lesson_columns(self):
+        """Столбцы уроков первой страницы; для одной ссылки lessons_next достаточно id"""
+        if "lessons" in self.fields:
+            return model_columns(self.fields["lessons"].child)
+        return {"id"}
+
+    def to_representation(self, instance):
+        if not hasattr(instance, "first_lessons") and self.needs_lessons():
+            load_first_lessons(instance, self.lesson_columns())
+        return super().to_representation(instance)
 
     class Meta:
         model = Course
-        fields = ("title", "lessons_count", "lessons", "subscription")
+        fields = ("title", "preview", "preview_variants", "lessons_count", "lessons", "lessons_next", "subscription")
+
+
+class SubscriptionBulkSerializer(serializers.Serializer):
+    """Массовая подписка (subscribe=true) или отписка (subscribe=false) от курсов"""
+    courses = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=BULK_SUBSCRIPTION_MAX_COURSES
+    )
+    subscribe = serializers.BooleanField(default=True)
 
+    def validate(self, attrs):
+        course_ids = sorted(set(attrs["courses"]))
+        if attrs["subscribe"]:
+            missing = set(course_ids) - set(Course.objects.filter(pk__in=course_ids).values_list("pk", flat=True))
+            if missing:
+                raise serializers.ValidationError({"courses": [f"Курсы не найдены: {sorted(missing)}"]})
+        return {**attrs, "courses": course_ids}
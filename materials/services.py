@@ -0,0 +1,62 @@
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+
+from materials.counters import batched_counters, change_counters
+from materials.models import Course, Subscription
+
+# Размер пачки для bulk_create подписок
+SUBSCRIPTION_BATCH_SIZE = 1000
+
+
+def lock_courses(course_ids):
+    """
+    Блокирует строки курсов до конца транзакции и возвращает id существующих.
+    Подписки одного курса меняются по очереди, поэтому subscribers_count сдвигается точно;
+    порядок по pk исключает взаимные блокировки.
+    """
+    return list(
+        Course.objects.select_for_update().filter(pk__in=course_ids).order_by("pk").values_list("pk", flat=True)
+    )
+
+
+@transaction.atomic
+def toggle_subscription(user, course_id):
+    """
+    Переключает подписку без гонок: под блокировкой курса DELETE, и только если удалять было нечего — INSERT.
+    Параллельные запросы ждут блокировку и не падают на unique_together.
+    subscribers_count обновляют сигналы подписки. Возвращает новое состояние: True — пользователь подписан.
+    """
+    course = get_object_or_404(Course.objects.select_for_update().only("pk"), pk=course_id)
+    deleted, _ = Subscription.objects.filter(user=user.pk, course=course).delete()
+    if not deleted:
+        Subscription.objects.create(user_id=user.pk, course=course)
+    return not deleted
+
+
+def subscribed_courses(user, course_ids):
+    return set(Subscription.objects.filter(user=user.pk, course__in=course_ids).values_list("course_id", flat=True))
+
+
+@transaction.atomic
+def subscribe(user, course_ids):
+    """
+    Подписывает пользователя на курсы одним INSERT; существующие подписки пропускаются.
+    bulk_create не отправляет сигналы, поэтому subscribers_count сдвигается здесь.
+    """
+    course_ids = lock_courses(course_ids)
+    existing = subscribed_courses(user, course_ids)
+    new = [course_id for course_id in course_ids if course_id not in existing]
+    Subscription.objects.bulk_create(
+        (Subscription(user_id=user.pk, course_id=course_id) for course_id in new),
+        ignore_conflicts=True,
+        batch_size=SUBSCRIPTION_BATCH_SIZE,
+    )
+    change_counters("subscribers_count", {course_id: 1 for course_id in new})
+
+
+@transaction.atomic
+def unsubscribe(user, course_ids):
+    """Отписывает пользователя от курсов одним DELETE; subscribers_count уменьшают сигналы подписки"""
+    course_ids = lock_courses(course_ids)
+    with batched_counters():
+        Subscription.objects.filter(user=user.pk, course__in=course_ids).delete()
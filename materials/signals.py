@@ -0,0 +1,99 @@
+from collections import Counter
+
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from materials.cache import bump_version
+from materials.counters import change_counters
+from materials.images import watch_image_field
+from materials.models import Course, Lesson, Subscription
+from materials.search import SEARCH_FIELDS, update_search_vectors
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_course(sender, instance, **kwargs):
+    """Сбрасывает закэшированные ответы курса"""
+    bump_version(f"course:{instance.pk}")
+
+
+@receiver(post_init, sender=Lesson)
+def remember_lesson_course(sender, instance, **kwargs):
+    """Запоминает курс урока, чтобы при переносе урока сбросить кэш обоих курсов"""
+    # Через __dict__, чтобы не загружать отложенное поле (.only()/.defer())
+    instance._loaded_course_id = instance.__dict__.get("course_id")
+
+
+def invalidate_lessons(course_ids):
+    """Сбрасывает список уроков и кэш перечисленных курсов (в т.ч. после bulk-операций без сигналов)"""
+    bump_version("lessons", *(f"course:{course_id}" for course_id in course_ids))
+
+
+def lesson_count_deltas(lessons, created=False, deleted=False):
+    """Изменения lessons_count курсов после создания, переноса или удаления уроков"""
+    deltas = Counter()
+    for lesson in lessons:
+        if deleted:
+            deltas[lesson.course_id] -= 1
+        elif created:
+            deltas[lesson.course_id] += 1
+        elif lesson._loaded_course_id != lesson.course_id:
+            deltas[lesson._loaded_course_id] -= 1
+            deltas[lesson.course_id] += 1
+    return deltas
+
+
+@receiver(post_save, sender=Lesson)
+def count_saved_lesson(sender, instance, created, **kwargs):
+    """Обновляет lessons_count при создании урока или переносе в другой курс"""
+    change_counters("lessons_count", lesson_count_deltas([instance], created=created))
+
+
+def deleted_with_course(origin):
+    """Объект удаляется каскадом вместе с курсом: счетчики курса обновлять незачем"""
+    return isinstance(origin, Course) or getattr(origin, "model", None) is Course
+
+
+@receiver(post_delete, sender=Lesson)
+def count_deleted_lesson(sender, instance, origin=None, **kwargs):
+    """Уменьшает lessons_count; при удалении самого курса счетчик не трогаем"""
+    if deleted_with_course(origin):
+        return
+    change_counters("lessons_count", lesson_count_deltas([instance], deleted=True))
+
+
+@receiver(post_save, sender=Subscription)
+def count_saved_subscription(sender, instance, created, **kwargs):
+    """Увеличивает subscribers_count при создании подписки (bulk_create сигналов не отправляет)"""
+    if created:
+        change_counters("subscribers_count", {instance.course_id: 1})
+
+
+@receiver(post_delete, sender=Subscription)
+def count_deleted_subscription(sender, instance, origin=None, **kwargs):
+    """Уменьшает subscribers_count, в т.ч. при каскадном удалении пользователя"""
+    if deleted_with_course(origin):
+        return
+    change_counters("subscribers_count", {instance.course_id: -1})
+
+
+# Счетчики обновляются до invalidate_lesson: он перезаписывает _loaded_course_id
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def invalidate_lesson(sender, instance, **kwargs):
+    """Сбрасывает список уроков и кэш курсов, в которых урок был или находится"""
+    invalidate_lessons({instance.course_id, instance._loaded_course_id} - {None})
+    instance._loaded_course_id = instance.course_id
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Lesson)
+def update_search_vector(sender, instance, update_fields=None, **kwargs):
+    """Пересчитывает поисковый вектор, если могли измениться название или описание"""
+    if update_fields is not None and not set(SEARCH_FIELDS) & set(update_fields):
+        return
+    update_search_vectors(sender, [instance.pk])
+
+
+watch_image_field(Course, "preview")
+watch_image_field(Lesson, "preview")
@@ -1,12 +1,24 @@
+import logging
 from datetime import timedelta
 
 from celery import shared_task
+from django.apps import apps
 from django.core.mail import send_mail
+from django.db.models import F
 from django.utils import timezone
+from PIL import Image
 
-from config.settings import EMAIL_HOST_USER
+from config.db_router import use_replica
+from config.locks import cache_lock
+from config.settings import (DEACTIVATE_USER_BATCH_SIZE, DEACTIVATE_USER_LOCK_TIMEOUT, EMAIL_HOST_USER,
+                             NOTIFICATION_BATCH_SIZE)
+from materials.images import build_variants, variants_field
+from materials.models import Subscription
+from users.authentication import forget_token_versions
 from users.models import User
 
+logger = logging.getLogger(__name__)
+
 
 @shared_task
 def send_info(course_id, recipients, message):
@@ -16,11 +28,81 @@ def send_info(course_id, recipients, message):
               EMAIL_HOST_USER, recipients)
 
 
+@shared_task
+def notify_course_subscribers(course_id, message):
+    """
+    Рассылает уведомление об обновлении курса всем подписчикам.
+    Адреса читаются из БД частями и отправляются пачками по NOTIFICATION_BATCH_SIZE
+    отдельными задачами send_info. Чтение идет с реплики, если она настроена.
+    """
+    with use_replica():
+        emails = (
+            Subscription.objects.filter(course_id=course_id)
+            .values_list("user__email", flat=True)
+            .order_by("pk")
+            .iterator(chunk_size=NOTIFICATION_BATCH_SIZE)
+        )
+        batch = []
+        for email in emails:
+            batch.append(email)
+            if len(batch) == NOTIFICATION_BATCH_SIZE:
+                send_info.delay(course_id, batch, message)
+                batch = []
+        if batch:
+            send_info.delay(course_id, batch, message)
+
+
 @shared_task
 def deactivate_user():
-    """Деактивирует пользователей, которые не входили в систему более 30 дней."""
-    today = timezone.now().date()
-    for user in User.objects.all():
-        if user.last_login and user.last_login.date() + timedelta(days=30) < today:
-            user.is_active = False
-            user.save()
+    """
+    Деактивирует пользователей, которые не входили в систему более 30 дней.
+    Обновляет записи пачками одним UPDATE на пачку и возвращает количество деактивированных.
+    """
+    with cache_lock("deactivate_user", DEACTIVATE_USER_LOCK_TIMEOUT) as acquired:
+        if not acquired:
+            # Задача уже выполняется на другом воркере
+            return 0
+
+        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        stale_users = User.objects.filter(is_active=True, last_login__lt=today - timedelta(days=30))
+
+        deactivated = 0
+        while True:
+            batch = stale_users.order_by("last_login").values_list("pk", flat=True)[:DEACTIVATE_USER_BATCH_SIZE]
+            user_ids = list(batch)
+            if not user_ids:
+                return deactivated
+            # Вместе с деактивацией отзываем выданные токены
+            deactivated += User.objects.filter(pk__in=user_ids).update(
+                is_active=False, token_version=F("token_version") + 1
+            )
+            forget_token_versions(user_ids)
+
+
+@shared_task
+def generate_image_variants(model_label, pk, field):
+    """
+    Создает варианты изображения (превью курса или урока, аватар) и сохраняет их имена в <field>_variants.
+    Если изображение успели заменить, ничего не делает: варианты создаст задача для нового файла.
+    """
+    instance = apps.get_model(model_label).objects.filter(pk=pk).first()
+    image = getattr(instance, field, None)
+    if not image:
+        return
+    source = image.name
+    try:
+        variants = build_variants(image)
+    except (OSError, Image.DecompressionBombError):
+        # Файл не открывается как изображение: вариантов нет, клиент использует оригинал
+        logger.warning("Не удалось создать варианты %s %s.%s", model_label, pk, field, exc_info=True)
+        variants = {"source": source}
+
+    instance.refresh_from_db(fields=[field])
+    if getattr(instance, field).name != source:
+        return
+    setattr(instance, variants_field(field), variants)
+    # Варианты входят в ответ с курсом и уроком, поэтому меняют и их версию (у пользователя updated_at нет)
+    update_fields = [variants_field(field)]
+    if any(model_field.name == "updated_at" for model_field in instance._meta.concrete_fields):
+        update_fields.append("updated_at")
+    instance.save(update_fields=update_fields)
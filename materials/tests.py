@@ -1,14 +1,45 @@
-from rest_framework.test import APITestCase
+from datetime import timedelta
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-from materials.models import Course, Lesson
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import AsyncClient, AsyncRequestFactory, RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from django.utils import timezone
+from rest_framework.test import APITestCase, force_authenticate
+
+from materials.models import Course, Lesson, Subscription
+from config.beat import LeaderDatabaseScheduler
+from config.celery import app
+from config.db_router import ReplicaRouter, ReplicaRoutingMiddleware, use_replica
+from config.locks import cache_lock
+from config.metrics import QueryCollector, registry
+from config.settings import CACHE_LOCATION, STRIPE_TIMEOUT
+from materials.async_views import AsyncCourseDetailView, AsyncCourseListView, AsyncLessonListView, \
+    AsyncLessonRetrieveView
+from materials.cache import cached_data
+from materials.checks import check_shared_cache
+from materials.management.commands.benchmark import SCENARIOS, check_budgets, route_names, updated_budget
+from materials.services import toggle_subscription
+from materials.tasks import deactivate_user, generate_image_variants, notify_course_subscribers
+from users.authentication import get_token_version, revoke_tokens
 from users.models import User
+from users.roles import user_is_moderator
 from django.shortcuts import reverse
 from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+from django_celery_beat.models import IntervalSchedule, PeriodicTask
 
 
 class LessonTestCase(APITestCase):
 
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create(email="test2@dwqdw.ru")
         self.course = Course.objects.create(title="Новый курс", description="Описание")
         self.lesson = Lesson.objects.create(
@@ -87,6 +118,7 @@ class LessonTestCase(APITestCase):
                     "title": self.lesson.title,
                     "description": self.lesson.description,
                     "preview": None,
+                    "preview_variants": None,
                     "course": self.lesson.course.pk,
                     "owner": self.lesson.owner.pk,
                 }
@@ -96,6 +128,90 @@ class LessonTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(data, result)
 
+    def test_lesson_list_cached(self):
+        """Повторный запрос списка уроков не обращается к БД, пока уроки не изменились."""
+        url = reverse("materials:lesson_list")
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.json()["count"], 1)
+
+        self.lesson.title = "Измененный урок"
+        self.lesson.save()
+        data = self.client.get(url).json()
+        self.assertEqual(data["results"][0]["title"], "Измененный урок")
+
+
+class LessonBulkTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="import@test.ru")
+        self.course = Course.objects.create(title="Курс", description="Описание", owner=self.user)
+        self.lesson = Lesson.objects.create(
+            title="Урок", description="Описание", video_url="https://www.youtube.com/1", course=self.course,
+            owner=self.user,
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("materials:lesson_bulk")
+
+    def lesson_data(self, title, **kwargs):
+        return {
+            "title": title,
+            "description": "Описание",
+            "video_url": "https://www.youtube.com/",
+            "course": self.course.pk,
+            **kwargs,
+        }
+
+    def test_lesson_bulk_create_and_update(self):
+        """Уроки создаются и изменяются за постоянное число запросов."""
+        data = [self.lesson_data("Урок 1", id=self.lesson.pk)] + [
+            self.lesson_data(f"Новый урок {i}") for i in range(50)
+        ]
+        with self.assertNumQueries(8):
+            response = self.client.post(self.url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.json()), 51)
+        self.assertEqual(response.json()[0]["title"], "Урок 1")
+        self.assertEqual(Lesson.objects.filter(owner=self.user, course=self.course).count(), 51)
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.title, "Урок 1")
+
+    def test_lesson_bulk_errors(self):
+        """Ошибки возвращаются по каждому элементу, ничего не сохраняется."""
+        data = [
+            self.lesson_data("Урок 1"),
+            self.lesson_data("Урок 2", video_url="https://rutube.ru/"),
+            self.lesson_data("Урок 3", id=123123),
+            self.lesson_data("Урок 4", course=123123),
+        ]
+        response = self.client.post(self.url, data, format="json")
+        errors = response.json()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(errors[0], {})
+        self.assertIn("video_url", errors[1])
+        self.assertIn("id", errors[2])
+        self.assertIn("course", errors[3])
+        self.assertEqual(Lesson.objects.count(), 1)
+
+    def test_lesson_bulk_owner_read_only(self):
+        """Владельца нельзя передать в запросе: новые уроки принадлежат автору, изменяемые — прежнему владельцу."""
+        other = User.objects.create(email="other@test.ru")
+        data = [
+            self.lesson_data("Урок 1", id=str(self.lesson.pk), owner=other.pk),
+            self.lesson_data("Новый урок", owner=other.pk, course=str(self.course.pk)),
+        ]
+        response = self.client.post(self.url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()[0]["title"], "Урок 1")
+        self.assertFalse(Lesson.objects.filter(owner=other).exists())
+        self.assertEqual(Lesson.objects.filter(owner=self.user, course=self.course).count(), 2)
+
+    def test_lesson_bulk_update_only(self):
+        """Запрос только с изменениями отвечает 200."""
+        response = self.client.post(self.url, [self.lesson_data("Урок 1", id=self.lesson.pk)], format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
 
 class SubscriptionTestCase(APITestCase):
     def setUp(self):
@@ -140,3 +256,773 @@ class SubscriptionTestCase(APITestCase):
             response.data.get("detail"),
             "No Course matches the given query.",
         )
+
+    def test_toggle_queries(self):
+        """Под блокировкой курса: подписка — выборка, INSERT и счетчик, отписка — выборка, DELETE и счетчик."""
+        url = reverse("materials:subscribe_view", args=(self.course.pk,))
+        with self.assertNumQueries(6):
+            self.assertTrue(toggle_subscription(self.user, self.course.pk))
+        Subscription.objects.bulk_create([Subscription(user=self.user, course=self.course)], ignore_conflicts=True)
+        with self.assertNumQueries(6):
+            response = self.client.post(url)
+        self.assertFalse(response.data["subscribed"])
+        self.assertFalse(Subscription.objects.exists())
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.subscribers_count, 0)
+
+    def test_bulk_subscribe(self):
+        """Массовая подписка пропускает существующие подписки, отписка удаляет все."""
+        other = Course.objects.create(title="Второй курс", description="Описание")
+        toggle_subscription(self.user, self.course.pk)
+        url = reverse("materials:subscribe_bulk")
+
+        response = self.client.post(url, {"courses": [other.pk, self.course.pk, other.pk]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"courses": sorted([self.course.pk, other.pk]), "subscribed": True})
+        self.assertEqual(Subscription.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(
+            list(Course.objects.order_by("pk").values_list("subscribers_count", flat=True)), [1, 1]
+        )
+
+        response = self.client.post(url, {"courses": [other.pk, 123123]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(url, {"courses": [other.pk, self.course.pk], "subscribe": False}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Subscription.objects.filter(user=self.user).exists())
+        self.assertEqual(
+            list(Course.objects.order_by("pk").values_list("subscribers_count", flat=True)), [0, 0]
+        )
+
+
+class CourseTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="course@test.ru")
+        self.client.force_authenticate(user=self.user)
+        for i in range(12):
+            course = Course.objects.create(title=f"Курс {i}", description="Описание", owner=self.user)
+            Lesson.objects.create(title="Урок", description="Описание", course=course, owner=self.user)
+            if i % 2:
+                Subscription.objects.create(user=self.user, course=course)
+
+    def test_course_list(self):
+        """Тест получения списка курсов с количеством уроков и подпиской."""
+        url = reverse("materials:courses-list")
+        response = self.client.get(url, {"page_size": 15})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = {item["title"]: item for item in response.json()["results"]}
+        self.assertEqual(results["Курс 0"]["lessons_count"], 1)
+        self.assertFalse(results["Курс 0"]["subscription"])
+        self.assertTrue(results["Курс 1"]["subscription"])
+
+    def test_course_list_query_count(self):
+        """Количество запросов не зависит от размера страницы."""
+        url = reverse("materials:courses-list")
+        for page_size in (1, 5, 15):
+            # Версия для ETag, COUNT и страница
+            with self.assertNumQueries(3):
+                self.client.get(url, {"page_size": page_size})
+
+    def test_course_list_cursor(self):
+        """Тест постраничного вывода курсов по курсору."""
+        url = reverse("materials:courses-list")
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {"pagination": "cursor", "page_size": 5})
+        data = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", data)
+        self.assertIsNone(data["previous"])
+        self.assertEqual([item["title"] for item in data["results"]], [f"Курс {i}" for i in range(5)])
+
+        titles = []
+        next_url = data["next"]
+        while next_url:
+            data = self.client.get(next_url).json()
+            titles.extend(item["title"] for item in data["results"])
+            next_url = data["next"]
+        self.assertEqual(titles, [f"Курс {i}" for i in range(5, 12)])
+        self.assertIsNotNone(data["previous"])
+
+    def test_course_retrieve(self):
+        """Тест получения информации о курсе."""
+        course = Course.objects.get(title="Курс 1")
+        url = reverse("materials:courses-detail", args=(course.pk,))
+        response = self.client.get(url)
+        data = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data["lessons_count"], 1)
+        self.assertEqual(len(data["lessons"]), 1)
+        self.assertTrue(data["subscription"])
+
+    def test_course_retrieve_lessons_page(self):
+        """В курсе только первая страница уроков, остальные — по курсору в /courses/<id>/lessons/."""
+        course = Course.objects.get(title="Курс 0")
+        Lesson.objects.bulk_create(
+            Lesson(title=f"Урок {i}", description="Описание", course=course, owner=self.user) for i in range(14)
+        )
+        data = self.client.get(reverse("materials:courses-detail", args=(course.pk,))).json()
+        self.assertEqual(len(data["lessons"]), 10)
+        titles = [lesson["title"] for lesson in data["lessons"]]
+
+        next_url = data["lessons_next"]
+        while next_url:
+            with self.assertNumQueries(2):
+                data = self.client.get(next_url).json()
+            titles.extend(lesson["title"] for lesson in data["results"])
+            next_url = data["next"]
+        self.assertEqual(titles, ["Урок"] + [f"Урок {i}" for i in range(14)])
+
+        other = User.objects.create(email="other@test.ru")
+        self.client.force_authenticate(user=other)
+        response = self.client.get(reverse("materials:course_lessons", args=(course.pk,)))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_course_retrieve_cached(self):
+        """Курс отдается из кэша и сбрасывается при изменении уроков и подписки."""
+        course = Course.objects.get(title="Курс 0")
+        url = reverse("materials:courses-detail", args=(course.pk,))
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            data = self.client.get(url).json()
+        self.assertFalse(data["subscription"])
+
+        Lesson.objects.create(title="Новый урок", description="Описание", course=course, owner=self.user)
+        Subscription.objects.create(user=self.user, course=course)
+        data = self.client.get(url).json()
+        self.assertEqual(data["lessons_count"], 2)
+        self.assertEqual(len(data["lessons"]), 2)
+        self.assertTrue(data["subscription"])
+
+
+class CourseCountersTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="counters@test.ru")
+        self.client.force_authenticate(user=self.user)
+        self.course = Course.objects.create(title="Первый", description="Описание")
+        self.other = Course.objects.create(title="Второй", description="Описание")
+
+    def counts(self, field):
+        return list(Course.objects.order_by("pk").values_list(field, flat=True))
+
+    def test_lesson_counter(self):
+        """lessons_count следует за созданием, переносом и удалением уроков."""
+        lesson = Lesson.objects.create(title="Урок", description="", course=self.course)
+        Lesson.objects.create(title="Урок 2", description="", course=self.course)
+        self.assertEqual(self.counts("lessons_count"), [2, 0])
+
+        lesson.course = self.other
+        lesson.save()
+        self.assertEqual(self.counts("lessons_count"), [1, 1])
+
+        lesson.delete()
+        self.assertEqual(self.counts("lessons_count"), [1, 0])
+
+    def test_subscription_counter(self):
+        """subscribers_count уменьшается при удалении пользователя вместе с его подписками."""
+        other_user = User.objects.create(email="other@test.ru")
+        toggle_subscription(self.user, self.course.pk)
+        toggle_subscription(other_user, self.course.pk)
+        toggle_subscription(other_user, self.other.pk)
+        self.assertEqual(self.counts("subscribers_count"), [2, 1])
+
+        other_user.delete()
+        self.assertEqual(self.counts("subscribers_count"), [1, 0])
+
+        self.other.delete()
+        self.course.delete()
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_ordering_and_recount(self):
+        """Сортировка по счетчику и исправление расхождений командой."""
+        toggle_subscription(self.user, self.other.pk)
+        response = self.client.get(reverse("materials:courses-list"), {"ordering": "-subscribers_count"})
+        self.assertEqual([course["title"] for course in response.data["results"]], ["Второй", "Первый"])
+
+        Course.objects.update(lessons_count=5, subscribers_count=0)
+        Lesson.objects.bulk_create([Lesson(title="Урок", description="", course=self.course)])
+        call_command("recount_course_counters", stdout=StringIO())
+        self.assertEqual(self.counts("lessons_count"), [1, 0])
+        self.assertEqual(self.counts("subscribers_count"), [0, 1])
+
+
+class ConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="etag@test.ru")
+        self.client.force_authenticate(user=self.user)
+        self.course = Course.objects.create(title="Курс", description="Описание", owner=self.user)
+        self.lesson = Lesson.objects.create(
+            title="Урок", description="Описание", video_url="https://www.youtube.com/", course=self.course,
+            owner=self.user,
+        )
+
+    def test_course_detail(self):
+        """Неизмененный курс отдается ответом 304 за один запрос; изменение урока меняет ETag."""
+        url = reverse("materials:courses-detail", args=(self.course.pk,))
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+
+        self.lesson.title = "Новое название"
+        self.lesson.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_course_list(self):
+        """ETag списка меняется при подписке и зависит от пользователя."""
+        url = reverse("materials:courses-list")
+        etag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        toggle_subscription(self.user, self.course.pk)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.force_authenticate(user=User.objects.create(email="other@test.ru"))
+        self.assertNotEqual(self.client.get(url)["ETag"], response["ETag"])
+
+    def test_lessons(self):
+        """Список уроков и урок отвечают 304 по If-None-Match и If-Modified-Since."""
+        url = reverse("materials:lesson_list")
+        etag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        url = reverse("materials:lesson_get", args=(self.lesson.pk,))
+        last_modified = self.client.get(url)["Last-Modified"]
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class SparseFieldsTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="fields@test.ru")
+        self.client.force_authenticate(user=self.user)
+        self.course = Course.objects.create(title="Курс", description="Описание курса", owner=self.user)
+        Lesson.objects.create(
+            title="Урок", description="Длинное описание", video_url="https://www.youtube.com/", course=self.course,
+            owner=self.user,
+        )
+
+    def get(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        return response, " ".join(query["sql"] for query in queries)
+
+    def test_lesson_fields(self):
+        """?fields= и ?omit= сокращают и ответ, и список столбцов в SQL."""
+        url = reverse("materials:lesson_list")
+        response, sql = self.get(url, {"fields": "id,title"})
+        self.assertEqual(response.json()["results"], [{"id": Lesson.objects.get().pk, "title": "Урок"}])
+        self.assertNotIn('"description"', sql)
+
+        response, sql = self.get(url, {"omit": "description"})
+        self.assertNotIn("description", response.json()["results"][0])
+        self.assertIn("video_url", response.json()["results"][0])
+        self.assertNotIn('"description"', sql)
+
+        response, _ = self.get(url, {"fields": "id,secret"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_course_fields(self):
+        """Курс не читает описание и поисковый вектор; ?fields= не действует на вложенные уроки."""
+        response, sql = self.get(reverse("materials:courses-list"), {})
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('"search_vector"', sql)
+
+        response, _ = self.get(reverse("materials:courses-detail", args=(self.course.pk,)), {"fields": "lessons"})
+        lessons = response.json()["lessons"]
+        self.assertEqual(list(response.json()), ["lessons"])
+        self.assertEqual(lessons[0]["description"], "Длинное описание")
+
+    def test_course_detail_lessons_columns(self):
+        """Уроки курса читаются без поискового вектора и не читаются, если их нет в ответе."""
+        url = reverse("materials:courses-detail", args=(self.course.pk,))
+        _, sql = self.get(url, {})
+        self.assertIn('"materials_lesson"."id"', sql)
+        self.assertNotIn('"search_vector"', sql)
+
+        cache.clear()
+        response, sql = self.get(url, {"fields": "title,lessons_count"})
+        self.assertEqual(response.json(), {"title": "Курс", "lessons_count": 1})
+        self.assertNotIn('"materials_lesson"."id"', sql)
+
+
+class BeatScheduleTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_sync_beat_schedule(self):
+        """Расписание из настроек переносится в БД повторяемо; лишние задачи отключаются по флагу."""
+        interval = IntervalSchedule.objects.create(every=1, period=IntervalSchedule.HOURS)
+        PeriodicTask.objects.create(name="old", task="materials.tasks.old", interval=interval)
+        call_command("sync_beat_schedule", stdout=StringIO())
+        call_command("sync_beat_schedule", disable_missing=True, stdout=StringIO())
+        task = PeriodicTask.objects.get(name="deactivate-inactive-users")
+        self.assertEqual(task.task, "materials.tasks.deactivate_user")
+        self.assertEqual((task.interval.every, task.interval.period), (24 * 60 * 60, IntervalSchedule.SECONDS))
+        self.assertFalse(PeriodicTask.objects.get(name="old").enabled)
+
+    def assert_leader_election(self):
+        first = LeaderDatabaseScheduler(app=app, lazy=True)
+        second = LeaderDatabaseScheduler(app=app, lazy=True)
+        with mock.patch("django_celery_beat.schedulers.DatabaseScheduler.tick", return_value=1) as tick:
+            first.tick()
+            second.tick()
+            self.assertEqual(tick.call_count, 1)
+            self.assertTrue(first.is_leader)
+            self.assertFalse(second.is_leader)
+
+            first.close()
+            second.tick()
+            self.assertTrue(second.is_leader)
+            self.assertEqual(tick.call_count, 2)
+            second.close()
+
+    def test_leader_election(self):
+        """Задачи отправляет только лидер; после его остановки лидером становится другой узел."""
+        with self.assertLogs("config.beat", "ERROR"):
+            self.assert_leader_election()
+
+    @skipUnless(CACHE_LOCATION, "Атомарная блокировка лидера работает на Redis")
+    def test_leader_election_redis(self):
+        """На Redis блокировка продлевается и снимается скриптами только узлом, который ее держит."""
+        self.assert_leader_election()
+        scheduler = LeaderDatabaseScheduler(app=app, lazy=True)
+        scheduler.redis.set(scheduler.leader_key, "other", px=10000)
+        self.assertFalse(scheduler.elect())
+        scheduler.is_leader = True
+        self.assertFalse(scheduler.renew_lock())
+        scheduler.release_lock()
+        self.assertEqual(scheduler.redis.get(scheduler.leader_key), b"other")
+        scheduler.redis.delete(scheduler.leader_key)
+
+
+class TaskQueuesTestCase(APITestCase):
+    def test_routes_and_policies(self):
+        """Письма, платежи и служебные задачи идут в свои очереди со своими политиками."""
+        expected = {
+            "materials.tasks.send_info": ("email", False, True),
+            "users.tasks.create_payment_session": ("payments", True, True),
+            "materials.tasks.deactivate_user": ("maintenance", True, False),
+            "materials.tasks.generate_image_variants": ("default", False, False),
+        }
+        for name, (queue, acks_late, ignore_result) in expected.items():
+            task = app.tasks[name]
+            self.assertEqual(app.amqp.router.route({}, name)["queue"].name, queue)
+            self.assertEqual((task.acks_late, task.ignore_result), (acks_late, ignore_result))
+
+        # Три запроса к Stripe укладываются в мягкий лимит, а он — в жесткий
+        payment = app.tasks["users.tasks.create_payment_session"]
+        self.assertLess(3 * STRIPE_TIMEOUT, payment.soft_time_limit)
+        self.assertLess(payment.soft_time_limit, payment.time_limit)
+
+
+class CourseNotificationTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="owner@test.ru")
+        self.course = Course.objects.create(title="Курс", description="Описание", owner=self.user)
+        for i in range(5):
+            subscriber = User.objects.create(email=f"subscriber{i}@test.ru")
+            Subscription.objects.create(user=subscriber, course=self.course)
+        self.client.force_authenticate(user=self.user)
+
+    @mock.patch("materials.views.notify_course_subscribers.delay")
+    def test_course_update_enqueues_notification(self, notify):
+        """Обновление курса ставит в очередь одну задачу рассылки."""
+        url = reverse("materials:courses-detail", args=(self.course.pk,))
+        response = self.client.patch(url, {"title": "Новое название"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        notify.assert_called_once_with(self.course.pk, "Изменен курс Новое название")
+
+    @mock.patch("materials.tasks.NOTIFICATION_BATCH_SIZE", 2)
+    @mock.patch("materials.tasks.send_info.delay")
+    def test_notifications_are_sent_in_batches(self, send_info):
+        """Адреса подписчиков рассылаются пачками ограниченного размера."""
+        notify_course_subscribers(self.course.pk, "Изменен курс")
+        batches = [call.args[1] for call in send_info.call_args_list]
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(
+            sorted(email for batch in batches for email in batch),
+            [f"subscriber{i}@test.ru" for i in range(5)],
+        )
+
+
+class DeactivateUserTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        self.stale = [
+            User.objects.create(email=f"stale{i}@test.ru", last_login=now - timedelta(days=40))
+            for i in range(3)
+        ]
+        self.recent = User.objects.create(email="recent@test.ru", last_login=now - timedelta(days=5))
+        self.never = User.objects.create(email="never@test.ru")
+
+    @mock.patch("materials.tasks.DEACTIVATE_USER_BATCH_SIZE", 2)
+    def test_deactivate_user(self):
+        """Деактивируются только пользователи, не входившие более 30 дней."""
+        self.assertEqual(deactivate_user(), 3)
+        self.assertEqual(User.objects.filter(is_active=False).count(), 3)
+        self.assertFalse(User.objects.filter(pk__in=[u.pk for u in self.stale], is_active=True).exists())
+        self.assertEqual(deactivate_user(), 0)
+
+    def test_deactivate_user_locked(self):
+        """Параллельный запуск задачи ничего не делает."""
+        with cache_lock("deactivate_user", 60):
+            self.assertEqual(deactivate_user(), 0)
+        self.assertFalse(User.objects.filter(is_active=False).exists())
+
+
+class ResponseCacheTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_single_flight(self):
+        """Пока ответ пересобирает другой процесс, запрос ждет его результат."""
+        build = mock.Mock(return_value="построено здесь")
+
+        def rebuilt_elsewhere(seconds):
+            cache.set("key", "построено другим процессом")
+
+        with cache_lock("key", 60), mock.patch("materials.cache.time.sleep", side_effect=rebuilt_elsewhere):
+            self.assertEqual(cached_data("key", build), "построено другим процессом")
+        build.assert_not_called()
+
+        self.assertEqual(cached_data("key", build), "построено другим процессом")
+        cache.clear()
+        self.assertEqual(cached_data("key", build), "построено здесь")
+        build.assert_called_once()
+
+    def test_shared_cache_check(self):
+        """check --deploy предупреждает, что кэш процесса не общий для процессов и воркеров."""
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ["materials.W001"])
+        redis = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://redis"}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class AsyncReadViewsTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="async@test.ru")
+        self.course = Course.objects.create(title="Курс", description="Описание", owner=self.user)
+        self.lesson = Lesson.objects.create(
+            title="Урок", description="Описание", video_url="https://www.youtube.com/", course=self.course,
+            owner=self.user,
+        )
+        toggle_subscription(self.user, self.course.pk)
+        self.factory = AsyncRequestFactory()
+
+    async def call(self, view, path, **kwargs):
+        request = self.factory.get(path)
+        force_authenticate(request, user=self.user)
+        response = await view.as_view()(request, **kwargs)
+        return response.render()
+
+    async def test_async_course_list(self):
+        """Асинхронный список курсов совпадает с синхронным."""
+        response = await self.call(AsyncCourseListView, "/courses/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["results"],
+            [{
+                "id": self.course.pk, "title": "Курс", "preview": None, "preview_variants": None, "lessons_count": 1,
+                "subscribers_count": 1, "subscription": True,
+            }],
+        )
+
+    async def test_async_course_retrieve(self):
+        """Асинхронное получение курса с уроками."""
+        response = await self.call(AsyncCourseDetailView, f"/courses/{self.course.pk}/", pk=self.course.pk)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["lessons_count"], 1)
+        self.assertEqual(response.data["lessons"][0]["title"], "Урок")
+
+        response = await self.call(AsyncCourseDetailView, "/courses/123123/", pk=123123)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_async_lessons(self):
+        """Асинхронные список и получение урока."""
+        response = await self.call(AsyncLessonListView, "/lesson/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 1)
+
+        response = await self.call(AsyncLessonRetrieveView, f"/lesson/{self.lesson.pk}/", pk=self.lesson.pk)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["title"], "Урок")
+
+    @mock.patch("materials.views.notify_course_subscribers.delay")
+    async def test_async_course_write_delegated(self, notify):
+        """Изменение курса через асинхронный маршрут выполняет CourseViewSet."""
+        request = self.factory.patch(
+            f"/courses/{self.course.pk}/", {"title": "Новое название"}, content_type="application/json"
+        )
+        force_authenticate(request, user=self.user)
+        response = await AsyncCourseDetailView.as_view()(request, pk=self.course.pk)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["title"], "Новое название")
+        notify.assert_called_once()
+
+
+class BenchmarkTestCase(APITestCase):
+
+    def test_scenarios_cover_routes(self):
+        self.assertEqual(route_names() - {scenario.route for scenario in SCENARIOS}, set())
+
+    def test_check_budgets(self):
+        budgets = {"lesson_list GET": {"queries": 2, "p95_ms": 10, "peak_kb": 100}}
+        slow = {"lesson_list GET": {"queries": 2, "p95_ms": 25, "peak_kb": 100}}
+        # Задержка сверяется только по флагу и с допуском
+        self.assertEqual(check_budgets(slow, budgets), [])
+        self.assertEqual(check_budgets(slow, budgets, check_latency=True), ["lesson_list GET: p95_ms 25 > 20"])
+        self.assertEqual(
+            check_budgets({"lesson_list GET": {"queries": 2, "p95_ms": 15, "peak_kb": 100}}, budgets, True), []
+        )
+        self.assertEqual(
+            check_budgets({"lesson_list GET": {"queries": 3, "p95_ms": 5, "peak_kb": 100}}, budgets),
+            ["lesson_list GET: queries 3 > 2"],
+        )
+        self.assertEqual(
+            check_budgets({"lesson_get GET": {"queries": 1, "p95_ms": 1, "peak_kb": 1}}, budgets),
+            ["lesson_get GET: нет бюджета"],
+        )
+
+    def test_updated_budget(self):
+        """Задержка и память в бюджете пересчитываются только при превышении, число запросов — всегда."""
+        budget = {"queries": 3, "p95_ms": 30, "peak_kb": 500}
+        self.assertEqual(
+            updated_budget(budget, {"queries": 2, "p95_ms": 5, "peak_kb": 300}),
+            {"queries": 2, "p95_ms": 30, "peak_kb": 500},
+        )
+        self.assertEqual(
+            updated_budget(budget, {"queries": 3, "p95_ms": 40, "peak_kb": 600}),
+            {"queries": 3, "p95_ms": 140, "peak_kb": 1456},
+        )
+        self.assertEqual(
+            updated_budget(None, {"queries": 1, "p95_ms": 5, "peak_kb": 100}),
+            {"queries": 1, "p95_ms": 35, "peak_kb": 456},
+        )
+
+
+@mock.patch("config.metrics.SERVER_TIMING", True)
+class QueryMetricsTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.user = User.objects.create(email="metrics@test.ru")
+        self.client.force_authenticate(user=self.user)
+
+    def test_server_timing_and_metrics(self):
+        """Разбивка времени в Server-Timing и гистограммы по шаблону маршрута."""
+        response = self.client.get(reverse("materials:lesson_list"))
+        self.assertIn('db;dur=', response["Server-Timing"])
+        self.assertIn('queries"', response["Server-Timing"])
+
+        staff = User.objects.create(email="staff@test.ru", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse("metrics"))
+        body = response.content.decode()
+        self.assertIn('http_request_db_queries_count{route="lesson/",method="GET"} 1', body)
+        self.assertIn('http_request_duration_seconds_bucket{route="lesson/",method="GET",le="+Inf"} 1', body)
+
+    def test_metrics_access(self):
+        """Без токена метрики видит только персонал, с токеном — любой, кто его предъявил."""
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, status.HTTP_403_FORBIDDEN)
+        with mock.patch("config.metrics.METRICS_TOKEN", "secret"):
+            self.client.logout()
+            response = self.client.get(reverse("metrics"), headers={"Authorization": "Bearer wrong"})
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get(reverse("metrics"), headers={"Authorization": "Bearer secret"})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    async def test_server_timing_async(self):
+        """Под ASGI заголовок добавляется и для асинхронного стека middleware."""
+        token = str(AccessToken.for_user(self.user))
+        response = await AsyncClient().get("/lesson/", headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('db;dur=0.0;desc="0 queries"', response["Server-Timing"])
+
+    def test_duplicate_queries(self):
+        """Повторяющийся SQL отмечается как N+1."""
+        collector = QueryCollector()
+        for _ in range(3):
+            collector(mock.Mock(), "SELECT 1 WHERE id = %s", (1,), False, {})
+        collector(mock.Mock(), "SELECT 2", (), False, {})
+        self.assertEqual(collector.count, 4)
+        self.assertEqual(collector.duplicates(), {"SELECT 1 WHERE id = %s": 3})
+
+
+@mock.patch("config.db_router.REPLICA_DATABASES", ["replica_1"])
+class ReplicaRoutingTestCase(TransactionTestCase):
+    # Без транзакции теста: внутри транзакции чтения всегда идут в основную БД
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.user = User.objects.create(email="replica@test.ru")
+        self.headers = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def test_router(self):
+        """Реплика используется только в контексте use_replica(), вне транзакции и до первой записи."""
+        self.assertEqual(self.router.db_for_read(Course), "default")
+        with use_replica():
+            self.assertEqual(self.router.db_for_read(Course), "replica_1")
+            with transaction.atomic():
+                self.assertEqual(self.router.db_for_read(Course), "default")
+            self.assertEqual(self.router.db_for_write(Course), "default")
+            self.assertEqual(self.router.db_for_read(Course), "default")
+        self.assertFalse(self.router.allow_migrate("replica_1", "materials"))
+
+    def test_middleware_pins_after_write(self):
+        """После своей записи пользователь читает из основной БД, остальные — с реплики."""
+        middleware = ReplicaRoutingMiddleware(lambda request: self.router.db_for_read(Course))
+        factory = RequestFactory()
+        self.assertEqual(middleware(factory.get("/courses/", headers=self.headers)), "replica_1")
+        self.assertEqual(middleware(factory.post("/courses/", headers=self.headers)), "default")
+        self.assertEqual(middleware(factory.get("/courses/", headers=self.headers)), "default")
+        self.assertEqual(middleware(factory.get("/courses/")), "replica_1")
+
+    def test_middleware_pins_session_and_admin(self):
+        """Запись через сессию закрепляет сессию за основной БД; админка всегда читает из основной БД."""
+        middleware = ReplicaRoutingMiddleware(lambda request: self.router.db_for_read(Course))
+        factory = RequestFactory()
+        factory.cookies["sessionid"] = "session-1"
+        self.assertEqual(middleware(factory.get("/courses/")), "replica_1")
+        self.assertEqual(middleware(factory.post("/courses/")), "default")
+        self.assertEqual(middleware(factory.get("/courses/")), "default")
+        self.assertEqual(middleware(RequestFactory().get("/courses/")), "replica_1")
+        self.assertEqual(middleware(RequestFactory().get("/admin/materials/course/")), "default")
+
+
+    def test_cache_rebuilt_from_primary(self):
+        """
+        Кэш версий токенов, ролей и ответов заполняется из основной БД, даже если запрос читает с реплики.
+        Реплика — зеркало основной БД: роутер запоминает, какие чтения ушли бы на нее с отставшими данными.
+        """
+        replica_reads = []
+        route = ReplicaRouter.db_for_read
+
+        def db_for_read(router, model, **hints):
+            database = route(router, model, **hints)
+            if database != "default":
+                replica_reads.append(model)
+            return "default"
+
+        moderator = User.objects.create(email="moder@test.ru")
+        with mock.patch.object(ReplicaRouter, "db_for_read", db_for_read), use_replica():
+            Course.objects.exists()
+            self.assertEqual(replica_reads, [Course])
+            replica_reads.clear()
+
+            revoke_tokens([self.user.pk])
+            with use_replica():
+                self.assertEqual(get_token_version(self.user.pk), 1)
+                self.assertFalse(user_is_moderator(moderator))
+                cached_data("materials:test", lambda: list(Course.objects.values_list("pk", flat=True)))
+        self.assertEqual(replica_reads, [])
+
+
+class SearchTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="search@test.ru")
+        self.client.force_authenticate(user=self.user)
+        self.course = Course.objects.create(title="Основы Python", description="Переменные и функции")
+        Course.objects.create(title="Рисование", description="Акварель для начинающих, немного Python")
+        self.lesson = Lesson.objects.create(
+            title="Функции", description="Аргументы функций", video_url="https://www.youtube.com/", course=self.course,
+        )
+
+    def test_search_requires_query(self):
+        response = self.client.get(reverse("materials:lesson_search"))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse("materials:courses-search"), {"q": " "})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @skipUnless(connection.vendor == "postgresql", "Полнотекстовый поиск работает только на Postgres")
+    def test_course_search_ranked(self):
+        """Совпадение в названии выше совпадения в описании."""
+        response = self.client.get(reverse("materials:courses-search"), {"q": "python"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 2)
+        self.assertEqual([course["title"] for course in response.data["results"]], ["Основы Python", "Рисование"])
+
+    @skipUnless(connection.vendor == "postgresql", "Полнотекстовый поиск работает только на Postgres")
+    def test_lesson_search_follows_writes(self):
+        """Вектор обновляется при сохранении и массовом изменении уроков."""
+        response = self.client.get(reverse("materials:lesson_search"), {"q": "функция"})
+        self.assertEqual([lesson["id"] for lesson in response.data["results"]], [self.lesson.pk])
+
+        self.lesson.title = "Классы"
+        self.lesson.description = "Наследование"
+        self.lesson.save()
+        response = self.client.get(reverse("materials:lesson_search"), {"q": "функция"})
+        self.assertEqual(response.data["count"], 0)
+
+        response = self.client.post(
+            reverse("materials:lesson_bulk"),
+            [{"title": "Функции высшего порядка", "description": "Замыкания", "video_url": "https://www.youtube.com/"}],
+            format="json",
+        )
+        response = self.client.get(reverse("materials:lesson_search"), {"q": "функция"})
+        self.assertEqual(response.data["results"][0]["title"], "Функции высшего порядка")
+
+
+class ImageVariantsTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.user = User.objects.create(email="images@test.ru")
+        self.course = Course.objects.create(title="Курс", description="Описание")
+        self.client.force_authenticate(user=self.user)
+
+    def upload(self):
+        buffer = BytesIO()
+        Image.new("RGB", (2000, 1000), "red").save(buffer, format="PNG")
+        return SimpleUploadedFile("preview.png", buffer.getvalue(), content_type="image/png")
+
+    @mock.patch("materials.tasks.generate_image_variants.delay")
+    def test_variants_generated_in_background(self, delay):
+        """Запрос не декодирует изображение; задача создает варианты с хешем содержимого в имени."""
+        data = {
+            "title": "Урок", "description": "Описание", "video_url": "https://www.youtube.com/",
+            "course": self.course.pk, "preview": self.upload(),
+        }
+        with mock.patch("PIL.Image.open", side_effect=AssertionError("декодирование в запросе")), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("materials:lesson_create"), data, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIsNone(response.data["preview_variants"])
+        delay.assert_called_once_with("materials.Lesson", response.data["id"], "preview")
+
+        generate_image_variants("materials.Lesson", response.data["id"], "preview")
+        response = self.client.get(reverse("materials:lesson_get", args=(response.data["id"],)))
+        variants = response.data["preview_variants"]
+        self.assertEqual(set(variants), {"small", "medium", "large"})
+        self.assertRegex(variants["small"]["webp"], r"/media/variants/[0-9a-f]{64}\.webp$")
+        self.assertRegex(variants["large"]["jpeg"], r"/media/variants/[0-9a-f]{64}\.jpg$")
+
+        lesson = Lesson.objects.get(pk=response.data["id"])
+        with lesson.preview.storage.open(lesson.preview_variants["small"]["jpeg"]) as file, Image.open(file) as image:
+            self.assertEqual(image.size, (320, 160))
+
+    def test_rejects_non_image_extension(self):
+        data = {"preview": SimpleUploadedFile("preview.exe", b"MZ")}
+        response = self.client.patch(reverse("materials:courses-detail", args=(self.course.pk,)), data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("preview", response.data)
@@ -1,8 +1,10 @@
+from config.settings import ASYNC_READ_VIEWS
 from materials.apps import MaterialsConfig
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 from materials.views import CourseViewSet, LessonCreateAPIView, LessonListAPIView, LessonRetrieveAPIView, \
-    LessonUpdateAPIView, LessonDestroyAPIView, SubscriptionView
+    LessonUpdateAPIView, LessonDestroyAPIView, SubscriptionView, LessonBulkAPIView, LessonSearchAPIView, \
+    SubscriptionBulkView, CourseLessonListAPIView
 
 app_name = MaterialsConfig.name
 
@@ -11,9 +13,25 @@ router.register(r"courses", CourseViewSet, basename="courses")
 
 urlpatterns = [
     path("lesson/create/", LessonCreateAPIView.as_view(), name="lesson_create"),
+    path("lesson/bulk/", LessonBulkAPIView.as_view(), name="lesson_bulk"),
     path("lesson/", LessonListAPIView.as_view(), name="lesson_list"),
+    path("lesson/search/", LessonSearchAPIView.as_view(), name="lesson_search"),
     path("lesson/<int:pk>/", LessonRetrieveAPIView.as_view(), name="lesson_get"),
     path("lesson/update/<int:pk>/", LessonUpdateAPIView.as_view(), name="lesson_update"),
     path("lesson/delete/<int:pk>/", LessonDestroyAPIView.as_view(), name="lesson_delete"),
+    path("courses/<int:course_id>/lessons/", CourseLessonListAPIView.as_view(), name="course_lessons"),
     path("<int:course_id>/subscribe/", SubscriptionView.as_view(), name="subscribe_view"),
+    path("subscribe/bulk/", SubscriptionBulkView.as_view(), name="subscribe_bulk"),
 ] + router.urls
+
+if ASYNC_READ_VIEWS:
+    # Под ASGI горячие маршруты чтения обслуживают асинхронные представления с теми же адресами и именами
+    from materials.async_views import AsyncCourseDetailView, AsyncCourseListView, AsyncLessonListView, \
+        AsyncLessonRetrieveView
+
+    urlpatterns = [
+        path("courses/", AsyncCourseListView.as_view(), name="courses-list"),
+        path("courses/<int:pk>/", AsyncCourseDetailView.as_view(), name="courses-detail"),
+        path("lesson/", AsyncLessonListView.as_view(), name="lesson_list"),
+        path("lesson/<int:pk>/", AsyncLessonRetrieveView.as_view(), name="lesson_get"),
+    ] + urlpatterns
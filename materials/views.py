@@ -1,15 +1,48 @@
+from django.db.models import Exists, OuterRef
+from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, generics
+from rest_framework.decorators import action
+from rest_framework.filters import OrderingFilter
+from materials.cache import cached_data, course_detail_key, lesson_list_key
+from materials.fieldsets import SparseFieldsViewMixin
+from materials.conditional import conditional_response, course_validators, lessons_updated_at, list_etag, make_etag
 from materials.models import Course, Lesson, Subscription
-from materials.paginators import MaterialsPaginator
-from materials.serializers import CourseSerializer, LessonSerializer, CourseDetailSerializer
+from materials.paginators import CourseLessonsPaginator, MaterialsPaginator, SearchPaginator
+from materials.search import apply_search
+from materials.serializers import CourseSerializer, LessonSerializer, CourseDetailSerializer, SubscriptionBulkSerializer
+from materials.services import subscribe, toggle_subscription, unsubscribe
 from users.permissions import IsModer, IsOwner
+from users.roles import is_moderator
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
-from django.shortcuts import get_object_or_404
 from rest_framework.response import Response
-from materials.tasks import send_info
+from rest_framework import status
+from materials.tasks import notify_course_subscribers
+
+
+class CourseQuerysetMixin(SparseFieldsViewMixin):
+    """Общий queryset и сортировка курсов для синхронных и асинхронных представлений"""
+    # Владельца читают проверки прав, время изменения — ETag
+    extra_columns = ("owner", "updated_at")
+    filter_backends = (OrderingFilter,)
+    # Сортировка по счетчикам читает столбцы курса, без COUNT по урокам и подпискам
+    ordering_fields = ("id", "lessons_count", "subscribers_count")
+    ordering = ("id",)
+
+    def get_queryset(self):
+        """Подписка текущего пользователя считается в том же SQL-запросе; счетчики хранятся в курсе."""
+        queryset = super().get_queryset().annotate(
+            is_subscribed=Exists(
+                Subscription.objects.filter(user=self.request.user.pk, course=OuterRef("pk"))
+            ),
+        )
+        if self.action == "retrieve":
+            # Курс отдается вместе с уроками, их изменения тоже входят в ETag
+            queryset = queryset.annotate(lessons_updated_at=lessons_updated_at())
+        return queryset
+
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(CourseQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = CourseSerializer
     queryset = Course.objects.all()
     pagination_class = MaterialsPaginator
@@ -20,6 +53,32 @@ class CourseViewSet(viewsets.ModelViewSet):
             return CourseDetailSerializer
         return CourseSerializer
 
+    def list(self, request, *args, **kwargs):
+        """
+        Отвечает 304, если курсы не менялись с версии клиента; подписка зависит от пользователя.
+        По курсору ETag не считается: агрегат по всей таблице свел бы на нет выигрыш от keyset.
+        """
+        page = super().list
+        if self.paginator.use_cursor(request):
+            return page(request, *args, **kwargs)
+        etag = list_etag(request, self.queryset, request.user.pk)
+        return conditional_response(request, lambda: page(request, *args, **kwargs), etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Отдает курс из кэша; ключ зависит от версии курса и подписки пользователя."""
+        course = self.get_object()
+        serializer = self.get_serializer(course)
+        key = course_detail_key(course.pk, course.is_subscribed, serializer.fields)
+        return conditional_response(
+            request, lambda: Response(cached_data(key, lambda: serializer.data)), *course_validators(request, course)
+        )
+
+    @action(detail=False, pagination_class=SearchPaginator)
+    def search(self, request, *args, **kwargs):
+        """Полнотекстовый поиск курсов по ?q=, самые релевантные первыми."""
+        page = self.paginate_queryset(apply_search(self.get_queryset(), request))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
     def perform_create(self, serializer):
         """Этот метод срабатывает, когда пользователь создает новый курс через API."""
 
@@ -40,11 +99,8 @@ class CourseViewSet(viewsets.ModelViewSet):
 
     def perform_update(self, serializer):
         course = serializer.save()
-        emails = []
-        subscriptions = Subscription.objects.filter(course=course)
-        for s in subscriptions:
-            emails.append(s.user.email)
-        send_info.delay(course.id, emails, f'Изменен курс {course.title}')
+        # Подписчиков собирает и оповещает фоновая задача
+        notify_course_subscribers.delay(course.id, f'Изменен курс {course.title}')
 
 
 class LessonCreateAPIView(generics.CreateAPIView):
@@ -54,21 +110,94 @@ class LessonCreateAPIView(generics.CreateAPIView):
     def perform_create(self, serializer):
         """ Этот метод срабатывает, когда пользователь создает новый урок через API."""
 
-        course = serializer.save()
-        course.owner = self.request.user
-        course.save()
+        serializer.save(owner=self.request.user)
+
+
+class LessonBulkAPIView(APIView):
+    """
+    Массовое создание и изменение уроков.
+    Принимает список уроков: элементы с id изменяют существующие уроки, остальные создаются.
+    Отвечает 201, если создан хотя бы один урок, и 200, если только изменены существующие.
+    """
+    permission_classes = (IsAuthenticated,)
+    max_items = 5000
+
+    def post(self, request, *args, **kwargs):
+        items = [item for item in request.data if isinstance(item, dict)] if isinstance(request.data, list) else []
+        is_moder = is_moderator(request)
+
+        serializer = LessonSerializer(data=request.data, many=True, max_length=self.max_items)
+        # Все уроки и курсы из запроса загружаются двумя запросами, а не по одному на элемент
+        lesson_ids, course_ids = serializer.requested_ids(items)
+        lessons = Lesson.objects.filter(pk__in=lesson_ids)
+        if not is_moder:
+            lessons = lessons.filter(owner=request.user.pk)
+        serializer.context.update({
+            "request": request,
+            "lessons": lessons.in_bulk(),
+            "courses": Course.objects.in_bulk(course_ids),
+            "can_create": not is_moder,
+        })
+        serializer.is_valid(raise_exception=True)
+        serializer.save(owner=request.user)
+        # 201 — если создан хотя бы один урок, 200 — если запрос только изменил существующие
+        response_status = status.HTTP_201_CREATED if serializer.created else status.HTTP_200_OK
+        return Response(serializer.data, status=response_status)
+
+
+class LessonListAPIView(SparseFieldsViewMixin, generics.ListAPIView):
+    serializer_class = LessonSerializer
+    queryset = Lesson.objects.all()
+    pagination_class = MaterialsPaginator
+
+    def list(self, request, *args, **kwargs):
+        """Отдает страницу уроков из кэша, пока уроки не изменились; 304, если страница у клиента актуальна."""
+        page = super().list
+
+        def build():
+            return page(request, *args, **kwargs).data
+
+        # Ключ кэша уже содержит версию уроков, поэтому ETag из него не требует запроса к БД
+        key = lesson_list_key(request)
+        return conditional_response(request, lambda: Response(cached_data(key, build)), make_etag(key))
 
 
-class LessonListAPIView(generics.ListAPIView):
+class CourseLessonListAPIView(SparseFieldsViewMixin, generics.ListAPIView):
+    """Уроки курса по курсору, по порядку id; права те же, что на просмотр курса"""
     serializer_class = LessonSerializer
     queryset = Lesson.objects.all()
-    pagination_class = MaterialsPaginator
+    pagination_class = CourseLessonsPaginator
+    permission_classes = (IsModer | IsOwner,)
+
+    def list(self, request, *args, **kwargs):
+        self.course = get_object_or_404(Course.objects.only("owner"), pk=kwargs["course_id"])
+        self.check_object_permissions(request, self.course)
+        return super().list(request, *args, **kwargs)
 
+    def get_queryset(self):
+        return super().get_queryset().filter(course=self.course)
 
-class LessonRetrieveAPIView(generics.RetrieveAPIView):
+
+class LessonSearchAPIView(SparseFieldsViewMixin, generics.ListAPIView):
+    """Полнотекстовый поиск уроков по ?q=, самые релевантные первыми"""
+    serializer_class = LessonSerializer
+    queryset = Lesson.objects.all()
+    pagination_class = SearchPaginator
+
+    def get_queryset(self):
+        return apply_search(super().get_queryset(), self.request)
+
+
+class LessonRetrieveAPIView(SparseFieldsViewMixin, generics.RetrieveAPIView):
     serializer_class = LessonSerializer
     queryset = Lesson.objects.all()
     permission_classes = (IsAuthenticated, IsModer | IsOwner)
+    extra_columns = ("owner", "updated_at")
+
+    def retrieve(self, request, *args, **kwargs):
+        lesson = self.get_object()
+        etag = make_etag(request.get_full_path(), lesson.updated_at)
+        return conditional_response(request, lambda: Response(self.get_serializer(lesson).data), etag, lesson.updated_at)
 
 
 class LessonUpdateAPIView(generics.UpdateAPIView):
@@ -85,22 +214,21 @@ class LessonDestroyAPIView(generics.DestroyAPIView):
 class SubscriptionView(APIView):
     """Класс для проверки подписан ли пользователь на курс или нет"""
     def post(self, request, course_id, *args, **kwargs):
-        user = request.user  # Получаем текущего пользователя
-
-        course_item = get_object_or_404(
-            Course, id=course_id
-        )  # Получаем объект курса или 404
-
-        # Проверяем, есть ли уже подписка
-        subs_item = Subscription.objects.filter(user=user, course=course_item)
-
-        if subs_item.exists():
-            subs_item.delete()
-            message = "Подписка удалена"
+        # Отписка — один DELETE, подписка — DELETE, проверка курса и INSERT без конфликтов
+        subscribed = toggle_subscription(request.user, course_id)
+        message = "Подписка добавлена" if subscribed else "Подписка удалена"
+        return Response({"message": message, "subscribed": subscribed})
+
+
+class SubscriptionBulkView(APIView):
+    """Подписка или отписка текущего пользователя от многих курсов одним запросом"""
+    def post(self, request, *args, **kwargs):
+        serializer = SubscriptionBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        course_ids = serializer.validated_data["courses"]
+        subscribed = serializer.validated_data["subscribe"]
+        if subscribed:
+            subscribe(request.user, course_ids)
         else:
-            Subscription.objects.create(
-                user=user, course=course_item
-            )  # Создаем подписку
-            message = "Подписка добавлена"
-
-        return Response({"message": message})
+            unsubscribe(request.user, course_ids)
+        return Response({"courses": course_ids, "subscribed": subscribed})
@@ -0,0 +1,113 @@
+from django.core.cache import cache
+from django.db.models import F
+from django.utils.functional import SimpleLazyObject
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from config.db_router import use_primary
+from config.settings import TOKEN_VERSION_CACHE_TIMEOUT
+from users.models import User
+
+# Claims, которые добавляются в токен при входе и обновлении
+ACTIVE_CLAIM = "is_active"
+MODER_CLAIM = "is_moder"
+TOKEN_VERSION_CLAIM = "token_version"
+
+
+def token_version_cache_key(user_id):
+    """Ключ кэша с текущей версией токенов пользователя"""
+    return f"users:token_version:{user_id}"
+
+
+def get_token_version(user_id):
+    """
+    Возвращает текущую версию токенов пользователя; БД читается только при промахе кэша.
+    Кэш заполняется из основной БД: отставшая реплика вернула бы версию до отзыва токенов
+    """
+    key = token_version_cache_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        with use_primary():
+            version = User.objects.filter(pk=user_id).values_list("token_version", flat=True).first()
+        if version is None:
+            raise AuthenticationFailed("Пользователь не найден", code="user_not_found")
+        cache.set(key, version, TOKEN_VERSION_CACHE_TIMEOUT)
+    return version
+
+
+def forget_token_versions(user_ids):
+    """Удаляет закэшированные версии токенов после их изменения в БД"""
+    cache.delete_many([token_version_cache_key(user_id) for user_id in user_ids])
+
+
+def revoke_tokens(user_ids):
+    """Отзывает выданные пользователям токены, увеличивая версию токенов"""
+    user_ids = list(user_ids)
+    User.objects.filter(pk__in=user_ids).update(token_version=F("token_version") + 1)
+    forget_token_versions(user_ids)
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    Пользователь, собранный из claims токена.
+    id, активность и роль модератора берутся из токена,
+    строка User загружается из БД только при обращении к остальным полям.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, token):
+        user_id = token[api_settings.USER_ID_CLAIM]
+        super().__init__(lambda: User.objects.get(pk=user_id))
+        self.__dict__["_user_id"] = user_id
+        self.__dict__["_is_active"] = token[ACTIVE_CLAIM]
+        self.__dict__["_is_moder"] = token[MODER_CLAIM]
+
+    @property
+    def pk(self):
+        return self.__dict__["_user_id"]
+
+    id = pk
+
+    @property
+    def is_active(self):
+        return self.__dict__["_is_active"]
+
+    @property
+    def is_moder(self):
+        return self.__dict__["_is_moder"]
+
+    def __bool__(self):
+        return True
+
+    def __eq__(self, other):
+        return isinstance(other, (User, ClaimsUser)) and other.pk == self.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    Аутентификация по JWT без загрузки пользователя из БД на каждый запрос.
+    Токен действителен, пока его версия совпадает с User.token_version.
+    Токены без claims (выданные до включения) проверяются как обычно.
+    """
+
+    def get_user(self, validated_token):
+        if TOKEN_VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Токен не содержит идентификатор пользователя")
+
+        if validated_token[TOKEN_VERSION_CLAIM] != get_token_version(user_id):
+            raise AuthenticationFailed("Токен отозван", code="token_revoked")
+        if not validated_token.get(ACTIVE_CLAIM):
+            raise AuthenticationFailed("Пользователь неактивен", code="user_inactive")
+
+        return ClaimsUser(validated_token)
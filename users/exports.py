@@ -0,0 +1,78 @@
+import csv
+import json
+from io import StringIO
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from config.settings import PAYMENT_EXPORT_CHUNK_SIZE
+
+# Столбцы выгрузки платежей: имена полей для values()
+PAYMENT_EXPORT_FIELDS = (
+    "id",
+    "payment_date",
+    "user",
+    "user__email",
+    "paid_course",
+    "separately_paid_lesson",
+    "payment_amount",
+    "payment_method",
+    "status",
+)
+
+
+def payment_rows(queryset):
+    """Строки платежей курсором на стороне сервера: в памяти не больше PAYMENT_EXPORT_CHUNK_SIZE строк"""
+    return queryset.order_by("pk").values_list(*PAYMENT_EXPORT_FIELDS).iterator(chunk_size=PAYMENT_EXPORT_CHUNK_SIZE)
+
+
+def chunked(rows, render):
+    """Склеивает строки выгрузки в куски по PAYMENT_EXPORT_CHUNK_SIZE, чтобы не отдавать каждую строку отдельно"""
+    buffer = []
+    for row in rows:
+        buffer.append(render(row))
+        if len(buffer) == PAYMENT_EXPORT_CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
+
+
+def export_csv(queryset):
+    """CSV с заголовком из PAYMENT_EXPORT_FIELDS"""
+    line = StringIO()
+    writer = csv.writer(line)
+
+    def render(row):
+        line.seek(0)
+        line.truncate()
+        writer.writerow(row)
+        return line.getvalue()
+
+    yield render(PAYMENT_EXPORT_FIELDS)
+    yield from chunked(payment_rows(queryset), render)
+
+
+def export_ndjson(queryset):
+    """Один JSON-объект на строку"""
+
+    def render(row):
+        return json.dumps(dict(zip(PAYMENT_EXPORT_FIELDS, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+    yield from chunked(payment_rows(queryset), render)
+
+
+async def aiterate(chunks):
+    """
+    Асинхронный поток кусков синхронной выгрузки для ASGI: каждый кусок читается из БД в потоке
+    через sync_to_async. Синхронный итератор ASGI-сервер Django сначала собрал бы целиком в память.
+    """
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+EXPORT_FORMATS = {
+    "csv": (export_csv, "text/csv; charset=utf-8"),
+    "ndjson": (export_ndjson, "application/x-ndjson; charset=utf-8"),
+}
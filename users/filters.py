@@ -1,6 +1,6 @@
 import django_filters
 
-from .models import Payment
+from .models import Payment, PaymentDailyRollup
 
 
 class PaymentFilter(django_filters.FilterSet):
@@ -21,3 +21,19 @@ class PaymentFilter(django_filters.FilterSet):
             "payment_amount",
             "payment_method",
         ]
+
+
+class PaymentRollupFilter(django_filters.FilterSet):
+    """ Фильтр для итогов платежей по дням"""
+
+    day = django_filters.DateFromToRangeFilter()
+    course = django_filters.NumberFilter()
+    payment_method = django_filters.ChoiceFilter(choices=Payment.PAYMENT_METHOD_CHOICES)
+
+    class Meta:
+        model = PaymentDailyRollup
+        fields = [
+            "day",
+            "course",
+            "payment_method",
+        ]
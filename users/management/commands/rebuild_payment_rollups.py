@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from users.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает итоги платежей по дням из таблицы платежей"
+
+    def handle(self, *args, **kwargs):
+        created = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано строк итогов: {created}"))
@@ -0,0 +1,265 @@
+import io
+import json
+import random
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import NOT_PROVIDED, JSONField
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
+from materials.cache import bump_version
+from materials.counters import recount_courses
+from materials.models import Course, Lesson, Subscription
+from materials.search import search_document
+from users.models import Payment, User
+from users.rollups import rebuild_rollups
+
+# Порядок загрузки: сначала таблицы, на которые ссылаются остальные
+MODELS = (User, Course, Lesson, Subscription, Payment)
+
+DEFAULT_PASSWORD = "staging"
+
+WORDS = (
+    "python django api база данных запрос модель сериализатор тест кэш индекс очередь задача "
+    "функция класс объект список словарь строка число цикл условие исключение модуль пакет"
+).split()
+
+
+class IteratorFile(io.TextIOBase):
+    """Файл только для чтения поверх генератора строк: COPY читает данные, не накапливая их в памяти"""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = ""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.lines)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self.buffer)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+
+def copy_value(field, value):
+    """Значение поля в текстовом формате COPY"""
+    if value is None:
+        return r"\N"
+    if isinstance(field, JSONField):
+        value = json.dumps(value, ensure_ascii=False)
+    elif isinstance(value, bool):
+        value = "t" if value else "f"
+    elif isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    elif isinstance(value, FieldFile):
+        # В БД хранится имя файла
+        if not value.name:
+            return r"\N"
+        value = value.name
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def copy_fields(model, with_pk):
+    """
+    Столбцы COPY; без id его выдает последовательность таблицы. Столбцы с db_default (например,
+    updated_at с auto_now, который Django заполняет только в save()) заполняет сама БД.
+    """
+    return [
+        field for field in model._meta.concrete_fields
+        if (with_pk or not field.primary_key) and field.db_default is NOT_PROVIDED
+    ]
+
+
+def copy_lines(fields, objects):
+    """Строки COPY для несохраненных объектов модели: все столбцы, включая значения по умолчанию Django"""
+    for obj in objects:
+        yield "\t".join(copy_value(field, getattr(obj, field.attname)) for field in fields) + "\n"
+
+
+def weighted_picker(rnd, items, distribution, skew):
+    """Выбор элементов: uniform — равновероятно, zipf — немногие популярные элементы выбираются чаще всех"""
+    if distribution == "uniform":
+        return lambda k: [rnd.choice(items) for _ in range(k)]
+    cum_weights = list(accumulate(1 / (rank + 1) ** skew for rank in range(len(items))))
+    return lambda k: rnd.choices(items, cum_weights=cum_weights, k=k)
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует синтетические данные (или импортирует CSV) и загружает их в Postgres через COPY: "
+        "вторичные индексы удаляются на время загрузки и пересоздаются, последовательности id выравниваются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--courses", type=int, default=1000)
+        parser.add_argument("--lessons-per-course", type=float, default=20, help="Среднее число уроков курса")
+        parser.add_argument("--subscriptions-per-user", type=float, default=3, help="Среднее число подписок")
+        parser.add_argument("--payments", type=int, default=50000)
+        parser.add_argument("--days", type=int, default=365, help="За сколько дней распределены платежи")
+        parser.add_argument(
+            "--distribution", choices=("uniform", "zipf"), default="zipf",
+            help="Как подписки и платежи распределены по курсам",
+        )
+        parser.add_argument("--skew", type=float, default=1.1, help="Показатель степени для zipf")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--import-dir",
+            help=(
+                "Вместо генерации загрузить <таблица>.csv с заголовком из столбцов БД (например, users_user.csv); "
+                "пропущенный столбец updated_at заполняется временем загрузки"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Загрузка через COPY работает только с Postgres")
+
+        with transaction.atomic():
+            indexes = self.drop_indexes()
+            if options["import_dir"]:
+                self.import_csv(Path(options["import_dir"]))
+            else:
+                self.generate(options)
+            self.reset_sequences()
+            # Поисковые векторы пишутся до создания GIN-индексов, а счетчикам нужны индексы по course_id
+            for model in (Course, Lesson):
+                model.objects.update(search_vector=search_document())
+            self.create_indexes(indexes)
+            recount_courses()
+            rebuild_rollups()
+
+        with connection.cursor() as cursor:
+            for model in MODELS:
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+        bump_version("lessons")
+        self.stdout.write(self.style.SUCCESS("Данные загружены"))
+
+    def drop_indexes(self):
+        """Удаляет вторичные индексы таблиц загрузки; индексы первичных ключей и ограничений остаются"""
+        tables = [model._meta.db_table for model in MODELS]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT index_class.relname, pg_get_indexdef(index_class.oid)
+                FROM pg_index
+                JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+                JOIN pg_class table_class ON table_class.oid = pg_index.indrelid
+                WHERE table_class.relname = ANY(%s)
+                  AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE pg_constraint.conindid = pg_index.indexrelid)
+                """,
+                [tables],
+            )
+            indexes = cursor.fetchall()
+            for name, _ in indexes:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+        self.stdout.write(f"Удалено индексов на время загрузки: {len(indexes)}")
+        return indexes
+
+    def create_indexes(self, indexes):
+        with connection.cursor() as cursor:
+            for _, definition in indexes:
+                cursor.execute(definition)
+        self.stdout.write(f"Пересоздано индексов: {len(indexes)}")
+
+    def reset_sequences(self):
+        """Выравнивает последовательности id по максимальному id после загрузки с явными id"""
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), MODELS):
+                cursor.execute(sql)
+
+    def copy(self, model, objects, with_pk=False):
+        fields = copy_fields(model, with_pk)
+        table = connection.ops.quote_name(model._meta.db_table)
+        columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN", IteratorFile(copy_lines(fields, objects)))
+            self.stdout.write(f"{model._meta.verbose_name_plural}: {cursor.rowcount}")
+
+    def import_csv(self, directory):
+        for model in MODELS:
+            path = directory / f"{model._meta.db_table}.csv"
+            if not path.exists():
+                continue
+            table = connection.ops.quote_name(model._meta.db_table)
+            with path.open(encoding="utf-8") as file:
+                header = file.readline()
+                columns = ", ".join(connection.ops.quote_name(column.strip()) for column in header.split(","))
+                with connection.cursor() as cursor:
+                    cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", file)
+                    self.stdout.write(f"{model._meta.verbose_name_plural}: {cursor.rowcount}")
+
+    def next_id(self, model):
+        last = model.objects.order_by("-pk").values_list("pk", flat=True).first()
+        return (last or 0) + 1
+
+    def generate(self, options):
+        rnd = random.Random(options["seed"])
+        now = timezone.now()
+        # Один хеш на всех пользователей: хеширование пароля на каждого заняло бы часы
+        password = make_password(DEFAULT_PASSWORD)
+
+        first_user = self.next_id(User)
+        user_ids = range(first_user, first_user + options["users"])
+        self.copy(User, (
+            User(
+                id=user_id, email=f"user{user_id}@staging.local", password=password, is_active=True,
+                date_joined=now - timedelta(days=rnd.randint(0, options["days"])),
+                last_login=now - timedelta(days=rnd.expovariate(1 / 20)),
+            )
+            for user_id in user_ids
+        ), with_pk=True)
+
+        first_course = self.next_id(Course)
+        course_ids = range(first_course, first_course + options["courses"])
+        self.copy(Course, (
+            Course(
+                id=course_id, title=f"Курс {course_id}", owner_id=rnd.choice(user_ids),
+                description=f"Описание курса {course_id}: " + " ".join(rnd.choices(WORDS, k=30)),
+            )
+            for course_id in course_ids
+        ), with_pk=True)
+
+        mean = options["lessons_per_course"]
+        self.copy(Lesson, (
+            Lesson(
+                title=f"Урок {number} курса {course_id}", course_id=course_id, owner_id=rnd.choice(user_ids),
+                description=" ".join(rnd.choices(WORDS, k=60)), video_url="https://www.youtube.com/",
+            )
+            for course_id in course_ids
+            for number in range(max(0, round(rnd.gauss(mean, mean / 3))))
+        ))
+
+        pick_courses = weighted_picker(rnd, list(course_ids), options["distribution"], options["skew"])
+        mean = options["subscriptions_per_user"]
+        self.copy(Subscription, (
+            Subscription(user_id=user_id, course_id=course_id)
+            for user_id in user_ids
+            # Повторный выбор того же курса схлопывается: пара пользователь-курс уникальна
+            for course_id in set(pick_courses(min(len(course_ids), round(rnd.expovariate(1 / mean)) if mean else 0)))
+        ))
+
+        methods = [choice for choice, _ in Payment.PAYMENT_METHOD_CHOICES]
+        self.copy(Payment, (
+            Payment(
+                user_id=rnd.choice(user_ids), paid_course_id=pick_courses(1)[0],
+                payment_date=(now - timedelta(days=rnd.randint(0, options["days"]))).date(),
+                payment_amount=Decimal(round(rnd.lognormvariate(8.5, 0.6), 2)).quantize(Decimal("0.01")),
+                payment_method=rnd.choice(methods), status=Payment.STATUS_READY,
+            )
+            for _ in range(options["payments"])
+        ))
+
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("users", "0003_payment_payment_link_payment_session_id_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(fields=["last_login"], name="users_user_last_login_idx"),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mark_ready_payments(apps, schema_editor):
+    """Платежи, у которых уже есть ссылка на оплату, считаются готовыми"""
+    Payment = apps.get_model("users", "Payment")
+    Payment.objects.filter(payment_link__isnull=False).update(status="ready")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0004_subscription"),
+        ("users", "0004_user_last_login_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Ожидает ссылку на оплату"),
+                    ("ready", "Ссылка на оплату готова"),
+                    ("failed", "Ошибка создания оплаты"),
+                ],
+                default="pending",
+                max_length=20,
+                verbose_name="Статус",
+            ),
+        ),
+        migrations.CreateModel(
+            name="StripePrice",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=10, verbose_name="Сумма"
+                    ),
+                ),
+                (
+                    "product_id",
+                    models.CharField(max_length=255, verbose_name="Id продукта"),
+                ),
+                ("price_id", models.CharField(max_length=255, verbose_name="Id цены")),
+                (
+                    "course",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="materials.course",
+                        verbose_name="Курс",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Цена в Stripe",
+                "verbose_name_plural": "Цены в Stripe",
+                "unique_together": {("course", "amount")},
+            },
+        ),
+        migrations.RunPython(mark_ready_payments, migrations.RunPython.noop),
+    ]
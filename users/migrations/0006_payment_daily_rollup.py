@@ -0,0 +1,91 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_rollups(apps, schema_editor):
+    """Заполняет итоги по уже существующим платежам"""
+    Payment = apps.get_model("users", "Payment")
+    PaymentDailyRollup = apps.get_model("users", "PaymentDailyRollup")
+    totals = (
+        Payment.objects.order_by()
+        .values("payment_date", "paid_course", "payment_method")
+        .annotate(total_amount=Sum("payment_amount"), payments_count=Count("pk"))
+    )
+    PaymentDailyRollup.objects.bulk_create(
+        PaymentDailyRollup(
+            day=row["payment_date"],
+            course_id=row["paid_course"],
+            payment_method=row["payment_method"],
+            total_amount=row["total_amount"],
+            payments_count=row["payments_count"],
+        )
+        for row in totals
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0004_subscription"),
+        ("users", "0005_stripe_price_payment_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="День")),
+                (
+                    "payment_method",
+                    models.CharField(
+                        choices=[("cash", "Наличные"), ("transfer", "Перевод на счет")],
+                        max_length=20,
+                        verbose_name="Способ оплаты",
+                    ),
+                ),
+                (
+                    "total_amount",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Сумма платежей",
+                    ),
+                ),
+                (
+                    "payments_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Количество платежей"
+                    ),
+                ),
+                (
+                    "course",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="materials.course",
+                        verbose_name="Курс",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Итоги платежей за день",
+                "verbose_name_plural": "Итоги платежей по дням",
+                "unique_together": {("day", "course", "payment_method")},
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0006_payment_daily_rollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="token_version",
+            field=models.PositiveIntegerField(default=0, verbose_name="Версия токенов"),
+        ),
+    ]
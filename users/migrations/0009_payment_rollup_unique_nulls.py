@@ -0,0 +1,47 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:14
+
+from django.db import migrations, models
+
+
+def merge_duplicates(apps, schema_editor):
+    """Сливает итоги без курса, которые успели задвоиться до появления ограничения"""
+    PaymentDailyRollup = apps.get_model("users", "PaymentDailyRollup")
+    duplicates = (
+        PaymentDailyRollup.objects.filter(course__isnull=True)
+        .values("day", "payment_method")
+        .annotate(rows=models.Count("pk"))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates:
+        rollups = list(PaymentDailyRollup.objects.filter(
+            course__isnull=True, day=group["day"], payment_method=group["payment_method"]
+        ).order_by("pk"))
+        first, rest = rollups[0], rollups[1:]
+        first.total_amount = sum(rollup.total_amount for rollup in rollups)
+        first.payments_count = sum(rollup.payments_count for rollup in rollups)
+        first.save()
+        PaymentDailyRollup.objects.filter(pk__in=[rollup.pk for rollup in rest]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0009_lesson_course_index"),
+        ("users", "0008_image_variants"),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name="paymentdailyrollup",
+            unique_together=set(),
+        ),
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="paymentdailyrollup",
+            constraint=models.UniqueConstraint(
+                fields=("day", "course", "payment_method"),
+                name="users_payment_rollup_unique",
+                nulls_distinct=False,
+            ),
+        ),
+    ]
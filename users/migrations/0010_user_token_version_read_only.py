@@ -0,0 +1,20 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0009_payment_rollup_unique_nulls"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="user",
+            name="token_version",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Версия токенов"
+            ),
+        ),
+    ]
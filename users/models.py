@@ -11,6 +11,8 @@ class User(AbstractUser):
     phone = models.CharField(max_length=15, **NULLABLE, verbose_name="Телефон")
     city = models.CharField(max_length=50, **NULLABLE, verbose_name="Город")
     avatar = models.ImageField(upload_to="avatars/", **NULLABLE, verbose_name="Аватар")
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Варианты аватара")
+    token_version = models.PositiveIntegerField(default=0, editable=False, verbose_name="Версия токенов")
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
@@ -21,6 +23,7 @@ class User(AbstractUser):
     class Meta:
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
+        indexes = [models.Index(fields=["last_login"], name="users_user_last_login_idx")]
 
 
 class Payment(models.Model):
@@ -28,6 +31,14 @@ class Payment(models.Model):
         ("cash", "Наличные"),
         ("transfer", "Перевод на счет"),
     ]
+    STATUS_PENDING = "pending"
+    STATUS_READY = "ready"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Ожидает ссылку на оплату"),
+        (STATUS_READY, "Ссылка на оплату готова"),
+        (STATUS_FAILED, "Ошибка создания оплаты"),
+    ]
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -66,6 +77,12 @@ class Payment(models.Model):
         **NULLABLE,
         verbose_name="Id сессии",
     )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        verbose_name="Статус",
+        default=STATUS_PENDING,
+    )
 
     def __str__(self):
         return f"{self.user} - {self.payment_amount} - {self.payment_date}"
@@ -73,3 +90,45 @@ class Payment(models.Model):
     class Meta:
         verbose_name = "Платеж"
         verbose_name_plural = "Платежи"
+
+
+class StripePrice(models.Model):
+    """Продукт и цена в Stripe, созданные для курса; переиспользуются для всех оплат с той же суммой"""
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name="Курс")
+    amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Сумма")
+    product_id = models.CharField(max_length=255, verbose_name="Id продукта")
+    price_id = models.CharField(max_length=255, verbose_name="Id цены")
+
+    def __str__(self):
+        return f"{self.course} - {self.amount}"
+
+    class Meta:
+        unique_together = ("course", "amount")
+        verbose_name = "Цена в Stripe"
+        verbose_name_plural = "Цены в Stripe"
+
+
+class PaymentDailyRollup(models.Model):
+    """Сумма и количество платежей за день по курсу и способу оплаты"""
+    day = models.DateField(verbose_name="День")
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name="Курс", **NULLABLE)
+    payment_method = models.CharField(
+        max_length=20,
+        choices=Payment.PAYMENT_METHOD_CHOICES,
+        verbose_name="Способ оплаты",
+    )
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Сумма платежей")
+    payments_count = models.PositiveIntegerField(default=0, verbose_name="Количество платежей")
+
+    def __str__(self):
+        return f"{self.day} - {self.course} - {self.payment_method}: {self.total_amount}"
+
+    class Meta:
+        # Итоги платежей без курса тоже уникальны: по умолчанию Postgres считает NULL различными (нужен PG 15+)
+        constraints = [
+            models.UniqueConstraint(
+                fields=("day", "course", "payment_method"), nulls_distinct=False, name="users_payment_rollup_unique"
+            ),
+        ]
+        verbose_name = "Итоги платежей за день"
+        verbose_name_plural = "Итоги платежей по дням"
@@ -1,12 +1,14 @@
 from rest_framework import permissions
 
+from users.roles import is_moderator
+
 
 class IsModer(permissions.BasePermission):
     """
         Проверяет, что пользователь является модератором.
         """
     def has_permission(self, request, view):
-        return request.user.groups.filter(name="moders").exists()
+        return is_moderator(request)
 
 
 class IsOwner(permissions.BasePermission):
@@ -15,6 +17,7 @@ class IsOwner(permissions.BasePermission):
     """
 
     def has_object_permission(self, request, view, obj):
-        if obj.owner == request.user:
+        # Сравнение по id не загружает владельца из БД
+        if obj.owner_id is not None and obj.owner_id == request.user.pk:
             return True
         return False
@@ -0,0 +1,65 @@
+from django.core.cache import cache
+
+from config.db_router import use_primary
+from config.settings import MODERATORS_GROUP, ROLE_CACHE_TIMEOUT
+from users.authentication import ClaimsUser
+
+
+def moderator_cache_key(user_id):
+    """Ключ кэша, в котором хранится признак модератора пользователя"""
+    return f"users:is_moder:{user_id}"
+
+
+def is_moderator(request):
+    """
+    Проверяет, состоит ли пользователь запроса в группе модераторов.
+    Результат запоминается на объекте запроса и в кэше Django,
+    поэтому составные права (IsModer | IsOwner) не делают повторных запросов к БД.
+    """
+    if not hasattr(request, "_is_moder"):
+        request._is_moder = user_is_moderator(request.user)
+    return request._is_moder
+
+
+async def ais_moderator(request):
+    """Асинхронный вариант is_moderator для асинхронных представлений"""
+    if not hasattr(request, "_is_moder"):
+        request._is_moder = await auser_is_moderator(request.user)
+    return request._is_moder
+
+
+def user_is_moderator(user):
+    """Признак модератора из claims токена, из кэша или, при промахе, из основной БД (реплика может отставать)"""
+    if not user or not user.is_authenticated:
+        return False
+    if isinstance(user, ClaimsUser):
+        return user.is_moder
+
+    key = moderator_cache_key(user.pk)
+    is_moder = cache.get(key)
+    if is_moder is None:
+        with use_primary():
+            is_moder = user.groups.filter(name=MODERATORS_GROUP).exists()
+        cache.set(key, is_moder, ROLE_CACHE_TIMEOUT)
+    return is_moder
+
+
+def invalidate_moderator_cache(user_ids):
+    """Сбрасывает закэшированные роли пользователей"""
+    cache.delete_many([moderator_cache_key(user_id) for user_id in user_ids])
+
+
+async def auser_is_moderator(user):
+    """Асинхронный вариант user_is_moderator"""
+    if not user or not user.is_authenticated:
+        return False
+    if isinstance(user, ClaimsUser):
+        return user.is_moder
+
+    key = moderator_cache_key(user.pk)
+    is_moder = await cache.aget(key)
+    if is_moder is None:
+        with use_primary():
+            is_moder = await user.groups.filter(name=MODERATORS_GROUP).aexists()
+        await cache.aset(key, is_moder, ROLE_CACHE_TIMEOUT)
+    return is_moder
@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from users.models import Payment, PaymentDailyRollup
+
+# Размер пачки при пересборке итогов
+REBUILD_BATCH_SIZE = 1000
+
+
+def payment_bucket(payment):
+    """День, курс, способ оплаты и сумма платежа, по которым он учитывается в итогах"""
+    amount = payment.payment_amount
+    return (
+        payment.payment_date,
+        payment.paid_course_id,
+        payment.payment_method,
+        None if amount is None else Decimal(str(amount)),
+    )
+
+
+def apply_payment(bucket, sign):
+    """
+    Прибавляет (sign=1) или вычитает (sign=-1) платеж из итогов его дня.
+    Вычитание меняет только существующую строку итогов и не создает пустую.
+    """
+    day, course_id, payment_method, amount = bucket
+    if day is None or amount is None:
+        return
+    rollups = PaymentDailyRollup.objects.filter(day=day, course_id=course_id, payment_method=payment_method)
+    with transaction.atomic():
+        if sign > 0:
+            PaymentDailyRollup.objects.get_or_create(day=day, course_id=course_id, payment_method=payment_method)
+        rollups.filter(payments_count__gte=-sign).update(
+            total_amount=F("total_amount") + sign * amount,
+            payments_count=F("payments_count") + sign,
+        )
+        if sign < 0:
+            rollups.filter(payments_count=0).delete()
+
+
+def rebuild_rollups():
+    """Пересчитывает итоги по всем платежам и возвращает количество строк итогов"""
+    totals = (
+        Payment.objects.order_by()
+        .values("payment_date", "paid_course", "payment_method")
+        .annotate(total_amount=Sum("payment_amount"), payments_count=Count("pk"))
+    )
+    rollups = (
+        PaymentDailyRollup(
+            day=row["payment_date"],
+            course_id=row["paid_course"],
+            payment_method=row["payment_method"],
+            total_amount=row["total_amount"],
+            payments_count=row["payments_count"],
+        )
+        for row in totals.iterator(chunk_size=REBUILD_BATCH_SIZE)
+    )
+    with transaction.atomic():
+        PaymentDailyRollup.objects.all().delete()
+        created = 0
+        batch = []
+        for rollup in rollups:
+            batch.append(rollup)
+            if len(batch) == REBUILD_BATCH_SIZE:
+                created += len(PaymentDailyRollup.objects.bulk_create(batch))
+                batch = []
+        created += len(PaymentDailyRollup.objects.bulk_create(batch))
+    return created
@@ -1,5 +1,11 @@
 from rest_framework.serializers import ModelSerializer
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from materials.images import ImageUploadField, ImageVariantsField
+from users.authentication import ACTIVE_CLAIM, MODER_CLAIM, TOKEN_VERSION_CLAIM
 from users.models import Payment, User
+from users.roles import user_is_moderator
 
 
 class PaymentSerializer(ModelSerializer):
@@ -15,10 +21,60 @@ class PaymentSerializer(ModelSerializer):
             "separately_paid_lesson",
             "payment_amount",
             "payment_method",
+            "status",
+            "payment_link",
         ]
+        read_only_fields = ["status", "payment_link"]
+
+
+class PaymentStatusSerializer(ModelSerializer):
+    """Статус создания ссылки на оплату, который опрашивает клиент"""
+
+    class Meta:
+        model = Payment
+        fields = ["id", "status", "payment_link"]
 
 
 class UserSerializer(ModelSerializer):
+    avatar = ImageUploadField(required=False, allow_null=True)
+    avatar_variants = ImageVariantsField("avatar")
+
     class Meta:
         model = User
         fields = "__all__"
+
+
+def add_user_claims(token, user):
+    """Добавляет в токен claims, по которым StatelessJWTAuthentication обходится без БД"""
+    token[ACTIVE_CLAIM] = user.is_active
+    token[MODER_CLAIM] = user_is_moderator(user)
+    token[TOKEN_VERSION_CLAIM] = user.token_version
+    return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Выдает пару токенов с claims пользователя"""
+
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Обновляет access токен, заново считывая claims пользователя из БД (один запрос на обновление)"""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        user = User.objects.filter(pk=refresh.get(api_settings.USER_ID_CLAIM)).first()
+        if user is None or not user.is_active:
+            raise InvalidToken("Пользователь не найден или неактивен")
+        # Новый access токен получает актуальные роль и версию токенов
+        add_user_claims(refresh, user)
+
+        data = {"access": str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data["refresh"] = str(refresh)
+        return data
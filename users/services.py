@@ -1,32 +1,95 @@
+import time
+from uuid import uuid4
+
 import stripe
+from django.utils.module_loading import import_string
 
-from config.settings import STRIPE_API_KEY
+from config.locks import cache_lock
+from config.settings import STRIPE_API_KEY, STRIPE_CLIENT, STRIPE_SUCCESS_URL, STRIPE_TIMEOUT
+from users.models import StripePrice
 
 stripe.api_key = STRIPE_API_KEY
+stripe.default_http_client = stripe.RequestsClient(timeout=STRIPE_TIMEOUT)
+
+# Блокировка создания цены курса: дольше двух обращений к Stripe
+STRIPE_PRICE_LOCK_TIMEOUT = 60
+STRIPE_PRICE_POLL_INTERVAL = 0.1
+
+
+class StripeClient:
+    """Клиент для работы с API Stripe"""
+
+    def create_product(self, name):
+        """Создает продукт в stripe и возвращает его ID"""
+        return stripe.Product.create(name=name).id
+
+    def create_price(self, amount, product_id):
+        """Создает цену в stripe и возвращает её ID"""
+        price = stripe.Price.create(
+            currency="rub",
+            unit_amount=int(amount * 100),
+            product=product_id
+        )
+        return price.id
+
+    def create_session(self, price_id):
+        """Создает сессию в Stripe и возвращает ID и URL сессии"""
+        session = stripe.checkout.Session.create(
+            success_url=STRIPE_SUCCESS_URL,
+            line_items=[{"price": price_id, "quantity": 1}],
+            mode="payment",
+        )
+        return session.id, session.url
+
+
+class FakeStripeClient:
+    """Локальная замена Stripe для разработки и тестов: ничего не отправляет в сеть"""
+
+    def create_product(self, name):
+        return f"prod_fake_{uuid4().hex}"
+
+    def create_price(self, amount, product_id):
+        return f"price_fake_{uuid4().hex}"
+
+    def create_session(self, price_id):
+        session_id = f"cs_fake_{uuid4().hex}"
+        return session_id, f"https://checkout.stripe.test/pay/{session_id}"
 
 
-def create_product(name):
-    """Создает продукт в stripe"""
-    product = stripe.Product.create(name=name)
-    return product
+def get_stripe_client():
+    """Возвращает клиент Stripe, указанный в настройке STRIPE_CLIENT"""
+    return import_string(STRIPE_CLIENT)()
 
 
-def create_price(price, name):
-    """Создает цену в stripe"""
-    product_id = create_product(name).id
-    response = stripe.Price.create(
-        currency="rub",
-        unit_amount=int(price * 100),
-        product=product_id
-    )
-    return response
+def get_course_price(client, course, amount):
+    """
+    Возвращает продукт и цену Stripe для курса, создавая их только при первом обращении.
+    Создает их один процесс под блокировкой, остальные ждут готовую цену, чтобы в Stripe
+    не оставались лишние продукты и цены.
+    """
+    prices = StripePrice.objects.filter(course=course, amount=amount)
+    price = prices.first()
+    while price is None:
+        with cache_lock(f"stripe-price:{course.pk}:{amount}", STRIPE_PRICE_LOCK_TIMEOUT) as acquired:
+            if acquired:
+                # Пока ждали блокировку, цену мог создать другой процесс
+                price = prices.first()
+                if price is None:
+                    product_id = client.create_product(course.title)
+                    price = StripePrice.objects.create(
+                        course=course,
+                        amount=amount,
+                        product_id=product_id,
+                        price_id=client.create_price(amount, product_id),
+                    )
+                return price
+        time.sleep(STRIPE_PRICE_POLL_INTERVAL)
+        price = prices.first()
+    return price
 
 
-def create_session(price, name):
-    """Создает сессию в Stripe и возвращает ID и URL сессии"""
-    session = stripe.checkout.Session.create(
-        success_url="http://127.0.0.1:8000/courses/",
-        line_items=[{"price": create_price(price, name), "quantity": 1}],
-        mode="payment",
-    )
-    return session.id, session.url
+def create_session(payment):
+    """Создает сессию оплаты в Stripe и возвращает ID и URL сессии"""
+    client = get_stripe_client()
+    price = get_course_price(client, payment.paid_course, payment.payment_amount)
+    return client.create_session(price.price_id)
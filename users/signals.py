@@ -0,0 +1,70 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from materials.images import watch_image_field
+from materials.signals import deleted_with_course
+from users.authentication import revoke_tokens
+from users.models import Payment, User
+from users.roles import invalidate_moderator_cache
+from users.rollups import apply_payment, payment_bucket
+
+
+def reset_roles(user_ids):
+    """Сбрасывает кэш ролей и отзывает токены, в которых записана старая роль"""
+    user_ids = list(user_ids)
+    invalidate_moderator_cache(user_ids)
+    revoke_tokens(user_ids)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def reset_user_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сбрасывает кэш ролей при изменении групп пользователя"""
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            reset_roles([instance.pk])
+        return
+
+    # Изменение со стороны группы: group.user_set.add(...) / clear()
+    if action == "pre_clear":
+        instance._cleared_user_ids = list(instance.user_set.values_list("pk", flat=True))
+    elif action == "post_clear":
+        reset_roles(getattr(instance, "_cleared_user_ids", []))
+    elif action in ("post_add", "post_remove"):
+        reset_roles(pk_set)
+
+
+@receiver(pre_delete, sender=Group)
+def reset_group_members_roles(sender, instance, **kwargs):
+    """При удалении группы сбрасывает кэш ролей её участников"""
+    reset_roles(instance.user_set.values_list("pk", flat=True))
+
+
+@receiver(post_init, sender=Payment)
+def remember_payment_bucket(sender, instance, **kwargs):
+    """Запоминает, в каких итогах учтен загруженный платеж"""
+    instance._rollup_bucket = payment_bucket(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=Payment)
+def update_payment_rollup(sender, instance, **kwargs):
+    """Переносит платеж в итоги нового дня, курса или способа оплаты"""
+    bucket = payment_bucket(instance)
+    if bucket != instance._rollup_bucket:
+        if instance._rollup_bucket is not None:
+            apply_payment(instance._rollup_bucket, -1)
+        apply_payment(bucket, 1)
+    instance._rollup_bucket = bucket
+
+
+@receiver(post_delete, sender=Payment)
+def remove_payment_from_rollup(sender, instance, origin=None, **kwargs):
+    """Вычитает удаленный платеж из итогов; итоги удаленного курса удаляются каскадом вместе с ним"""
+    # Платеж за урок удаленного курса учтен в итогах без курса, их нужно уменьшить
+    if deleted_with_course(origin) and instance.paid_course_id is not None:
+        return
+    if instance._rollup_bucket is not None:
+        apply_payment(instance._rollup_bucket, -1)
+
+
+watch_image_field(User, "avatar")
@@ -0,0 +1,34 @@
+import logging
+
+import stripe
+from celery import shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+
+from users.models import Payment
+from users.services import create_session
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=10)
+def create_payment_session(self, payment_id):
+    """Создает сессию оплаты в Stripe и сохраняет ссылку на оплату в платеже"""
+    payment = Payment.objects.select_related("paid_course").get(pk=payment_id)
+    if payment.status != Payment.STATUS_PENDING:
+        return
+
+    try:
+        session_id, payment_link = create_session(payment)
+    # Мягкий лимит времени очереди payments: платеж отмечается до того, как воркер остановит задачу
+    except (stripe.error.StripeError, SoftTimeLimitExceeded) as e:
+        if self.request.retries >= self.max_retries:
+            logger.error("Ошибка при создании сессии Stripe для платежа %s: %s", payment_id, e)
+            Payment.objects.filter(pk=payment_id).update(status=Payment.STATUS_FAILED)
+            raise
+        raise self.retry(exc=e)
+
+    Payment.objects.filter(pk=payment_id).update(
+        session_id=session_id,
+        payment_link=payment_link,
+        status=Payment.STATUS_READY,
+    )
@@ -1,3 +1,370 @@
-from django.test import TestCase
+import csv
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from celery.exceptions import SoftTimeLimitExceeded
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import NOT_PROVIDED, Sum
+from django.db.models.expressions import DatabaseDefault
+from django.utils import timezone
+from django.shortcuts import reverse
+from django.test import AsyncClient, TestCase
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from config.locks import cache_lock
+from materials.models import Course, Lesson, Subscription
+from materials.tasks import deactivate_user
+from users.authentication import StatelessJWTAuthentication
+from users.management.commands.seed_data import Command as SeedDataCommand, copy_fields, copy_lines
+from users.models import Payment, PaymentDailyRollup, StripePrice, User
+from users.permissions import IsModer, IsOwner
+from users.services import get_course_price
+from users.tasks import create_payment_session
+
+
+class ModeratorRoleTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="moder@test.ru")
+        self.group = Group.objects.create(name="moders")
+        self.factory = APIRequestFactory()
+
+    def make_request(self):
+        request = self.factory.get("/")
+        request.user = self.user
+        return request
+
+    def test_role_is_memoized_per_request(self):
+        """Составные права проверяют группу одним запросом."""
+        request = self.make_request()
+        with self.assertNumQueries(1):
+            self.assertFalse(IsModer().has_permission(request, None))
+            self.assertTrue((~IsModer)().has_permission(request, None))
+            self.assertTrue((IsModer | IsOwner)().has_permission(request, None))
+
+    def test_role_is_cached_between_requests(self):
+        """Повторные запросы не обращаются к БД."""
+        IsModer().has_permission(self.make_request(), None)
+        with self.assertNumQueries(0):
+            self.assertFalse(IsModer().has_permission(self.make_request(), None))
+
+    def test_cache_invalidated_on_groups_change(self):
+        """Изменение групп пользователя сбрасывает кэш роли."""
+        self.assertFalse(IsModer().has_permission(self.make_request(), None))
+        self.user.groups.add(self.group)
+        self.assertTrue(IsModer().has_permission(self.make_request(), None))
+        self.group.user_set.clear()
+        self.assertFalse(IsModer().has_permission(self.make_request(), None))
+
+
+@mock.patch("users.services.STRIPE_CLIENT", "users.services.FakeStripeClient")
+@mock.patch("users.views.create_payment_session.delay", side_effect=create_payment_session)
+class PaymentTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="payer@test.ru")
+        self.course = Course.objects.create(title="Курс", description="Описание")
+        self.client.force_authenticate(user=self.user)
+
+    def create_payment(self, amount="1000.00"):
+        url = reverse("users:payment_create", args=(self.course.pk,))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {"payment_amount": amount})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["status"], Payment.STATUS_PENDING)
+        return response.json()["id"]
+
+    def test_payment_session_created_in_background(self, create_session_task):
+        """Ссылка на оплату появляется в статусе платежа после выполнения задачи."""
+        payment_id = self.create_payment()
+        create_session_task.assert_called_once_with(payment_id)
+
+        response = self.client.get(reverse("users:payment_status", args=(payment_id,)))
+        data = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data["status"], Payment.STATUS_READY)
+        self.assertTrue(data["payment_link"].startswith("https://checkout.stripe.test/"))
+
+    def test_stripe_price_is_reused(self, create_session_task):
+        """Продукт и цена Stripe создаются один раз на курс и сумму."""
+        self.create_payment()
+        self.create_payment()
+        self.create_payment("500.00")
+        self.assertEqual(StripePrice.objects.filter(course=self.course).count(), 2)
+        self.assertEqual(Payment.objects.filter(status=Payment.STATUS_READY).count(), 3)
+
+    @mock.patch("users.tasks.create_session", side_effect=SoftTimeLimitExceeded)
+    def test_payment_failed_on_soft_time_limit(self, create_session, create_session_task):
+        """Задача, не уложившаяся в мягкий лимит времени, повторяется, а после последней попытки отмечает платеж."""
+        payment = Payment.objects.create(user=self.user, paid_course=self.course, payment_amount=Decimal("1000.00"))
+        result = create_payment_session.apply(args=(payment.pk,), retries=create_payment_session.max_retries)
+        self.assertIsInstance(result.result, SoftTimeLimitExceeded)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.STATUS_FAILED)
+
+    def test_stripe_price_created_once_under_lock(self, create_session_task):
+        """Пока цену создает другой процесс, Stripe не вызывается: берется его цена."""
+        client = mock.Mock()
+        amount = Decimal("1000.00")
+
+        def other_process_creates(seconds):
+            StripePrice.objects.create(course=self.course, amount=amount, product_id="prod_1", price_id="price_1")
+
+        with cache_lock(f"stripe-price:{self.course.pk}:{amount}", 60):
+            with mock.patch("users.services.time.sleep", side_effect=other_process_creates):
+                price = get_course_price(client, self.course, amount)
+        self.assertEqual(price.price_id, "price_1")
+        client.create_product.assert_not_called()
+
+
+class PaymentExportTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create(email="accounting@test.ru", is_staff=True)
+        self.course = Course.objects.create(title="Курс", description="Описание")
+        self.client.force_authenticate(user=self.admin)
+        Payment.objects.bulk_create(
+            Payment(user=self.admin, paid_course=self.course, payment_amount=Decimal(amount), payment_method=method)
+            for amount, method in [("100.00", "cash"), ("250.50", "transfer"), ("300.00", "cash")]
+        )
+        self.url = reverse("users:payment_export")
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    @mock.patch("users.exports.PAYMENT_EXPORT_CHUNK_SIZE", 2)
+    def test_export_csv(self):
+        """CSV отдается потоком кусками по PAYMENT_EXPORT_CHUNK_SIZE строк с учетом фильтров."""
+        response = self.client.get(self.url, {"payment_method": "cash"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        rows = list(csv.DictReader(StringIO(self.content(response))))
+        self.assertEqual([row["payment_amount"] for row in rows], ["100.00", "300.00"])
+        self.assertEqual(rows[0]["user__email"], "accounting@test.ru")
+
+    def test_export_ndjson(self):
+        response = self.client.get(self.url, {"file_format": "ndjson", "payment_amount_min": "200"})
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([row["payment_amount"] for row in rows], ["250.50", "300.00"])
+
+    @mock.patch("users.exports.PAYMENT_EXPORT_CHUNK_SIZE", 2)
+    async def test_export_asgi(self):
+        """Под ASGI выгрузка отдается асинхронным потоком по кускам, а не собирается целиком."""
+        token = str(AccessToken.for_user(self.admin))
+        response = await AsyncClient().get(self.url, headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 3)
+        rows = list(csv.DictReader(StringIO(b"".join(chunks).decode())))
+        self.assertEqual([row["payment_amount"] for row in rows], ["100.00", "250.50", "300.00"])
+
+    def test_export_validation(self):
+        response = self.client.get(self.url, {"file_format": "xlsx"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(user=User.objects.create(email="user@test.ru"))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class PaymentReportTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create(email="finance@test.ru", is_staff=True)
+        self.course = Course.objects.create(title="Курс", description="Описание")
+        self.other_course = Course.objects.create(title="Другой курс", description="Описание")
+        self.client.force_authenticate(user=self.admin)
+
+    def create_payment(self, amount, course=None, method="transfer"):
+        return Payment.objects.create(
+            user=self.admin, paid_course=course or self.course, payment_amount=amount, payment_method=method
+        )
+
+    def test_rollup_maintained_on_write(self):
+        """Итоги обновляются при создании, изменении и удалении платежей."""
+        self.create_payment("100.00")
+        payment = self.create_payment("50.00")
+        self.create_payment("30.00", method="cash")
+
+        rollup = PaymentDailyRollup.objects.get(course=self.course, payment_method="transfer")
+        self.assertEqual((rollup.total_amount, rollup.payments_count), (Decimal("150.00"), 2))
+
+        payment.paid_course = self.other_course
+        payment.save()
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.total_amount, rollup.payments_count), (Decimal("100.00"), 1))
+
+        payment.delete()
+        self.assertFalse(PaymentDailyRollup.objects.filter(course=self.other_course).exists())
+
+    def test_rollup_course_deleted(self):
+        """Удаление курса с платежами удаляет его итоги и не создает пустых строк."""
+        lesson = Lesson.objects.create(title="Урок", description="", course=self.course)
+        self.create_payment("100.00")
+        self.create_payment("30.00", method="cash")
+        Payment.objects.create(user=self.admin, separately_paid_lesson=lesson, payment_amount="20.00")
+        self.create_payment("50.00", course=self.other_course)
+
+        self.course.delete()
+        self.assertFalse(Payment.objects.filter(paid_course__isnull=True).exists())
+        self.assertEqual(
+            list(PaymentDailyRollup.objects.values_list("course", "total_amount")),
+            [(self.other_course.pk, Decimal("50.00"))],
+        )
+
+    @skipUnless(connection.vendor == "postgresql", "NULLS NOT DISTINCT поддерживает Postgres 15+")
+    def test_rollup_without_course_unique(self):
+        """Итоги платежей без курса не задваиваются."""
+        PaymentDailyRollup.objects.create(day=timezone.localdate(), course=None, payment_method="cash")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PaymentDailyRollup.objects.create(day=timezone.localdate(), course=None, payment_method="cash")
+
+    def test_rebuild_command(self):
+        """Команда пересобирает итоги по таблице платежей."""
+        self.create_payment("100.00")
+        self.create_payment("30.00", method="cash")
+        PaymentDailyRollup.objects.update(total_amount=0)
+
+        call_command("rebuild_payment_rollups", stdout=StringIO())
+        self.assertEqual(PaymentDailyRollup.objects.count(), 2)
+        self.assertEqual(PaymentDailyRollup.objects.aggregate(total=Sum("total_amount"))["total"], Decimal("130.00"))
+
+    def test_payment_report(self):
+        """Отчет о выручке читается из итогов одним запросом на группировку."""
+        self.create_payment("100.00")
+        self.create_payment("50.00", course=self.other_course)
+        self.create_payment("30.00", method="cash")
+
+        url = reverse("users:payment_report")
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {"group_by": "course", "payment_method": "transfer"})
+        data = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data["payments_count"], 2)
+        self.assertEqual(
+            [(row["course"], row["payments_count"]) for row in data["results"]],
+            [(self.course.pk, 1), (self.other_course.pk, 1)],
+        )
+
+        response = self.client.get(url, {"group_by": "year"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SeedDataTestCase(TestCase):
+    def test_requires_postgres(self):
+        """Загрузка через COPY недоступна на других СУБД."""
+        if connection.vendor == "postgresql":
+            self.skipTest("Проверка для СУБД без COPY")
+        with self.assertRaises(CommandError):
+            call_command("seed_data", users=1, courses=1, stdout=StringIO())
+
+    def test_generated_rows_fill_required_columns(self):
+        """Строки COPY заполняют все NOT NULL столбцы; auto_now, который Django ставит только в save(), заполняет БД."""
+        copied = {}
+
+        def copy(model, objects, with_pk=False):
+            objects = list(objects)
+            copied[model] = (copy_fields(model, with_pk), objects)
+
+        options = {
+            "users": 3, "courses": 2, "lessons_per_course": 3, "subscriptions_per_user": 1, "payments": 3,
+            "days": 10, "distribution": "zipf", "skew": 1.1, "seed": 0,
+        }
+        with mock.patch.object(SeedDataCommand, "copy", side_effect=copy):
+            SeedDataCommand().generate(options)
+        for model, (fields, objects) in copied.items():
+            skipped = {field for field in model._meta.concrete_fields if not field.null} - set(fields)
+            self.assertTrue(all(field.primary_key or field.db_default is not NOT_PROVIDED for field in skipped), model)
+            for obj in objects:
+                for field in fields:
+                    value = getattr(obj, field.attname)
+                    self.assertNotIsInstance(value, DatabaseDefault, f"{model.__name__}.{field.name}")
+                    if not field.null:
+                        self.assertIsNotNone(value, f"{model.__name__}.{field.name}")
+            list(copy_lines(fields, objects))
+
+    @skipUnless(connection.vendor == "postgresql", "COPY доступен только в Postgres")
+    def test_seed_data(self):
+        """Данные загружены, производные поля посчитаны, последовательности id выровнены."""
+        call_command(
+            "seed_data", users=20, courses=5, lessons_per_course=4, subscriptions_per_user=2, payments=30,
+            stdout=StringIO(),
+        )
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Course.objects.count(), 5)
+        self.assertEqual(Payment.objects.count(), 30)
+        for course in Course.objects.all():
+            self.assertEqual(course.lessons_count, Lesson.objects.filter(course=course).count())
+            self.assertEqual(course.subscribers_count, Subscription.objects.filter(course=course).count())
+        self.assertEqual(
+            PaymentDailyRollup.objects.aggregate(total=Sum("payments_count"))["total"], Payment.objects.count()
+        )
+        self.assertFalse(Course.objects.filter(search_vector__isnull=True).exists())
+        User.objects.create(email="after-seed@test.ru")
+        Course.objects.create(title="Новый курс", description="Описание")
+
+
+class StatelessAuthTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="stateless@test.ru")
+        self.user.set_password("password")
+        self.user.save()
+        self.factory = APIRequestFactory()
+        response = self.client.post(reverse("users:login"), {"email": "stateless@test.ru", "password": "password"})
+        self.tokens = response.json()
+
+    def authenticate(self, access):
+        request = Request(self.factory.get("/", HTTP_AUTHORIZATION=f"Bearer {access}"))
+        user, _ = StatelessJWTAuthentication().authenticate(request)
+        request.user = user
+        return request
+
+    def test_claims_authentication_without_queries(self):
+        """Пользователь и его роль берутся из claims токена без запросов к БД."""
+        self.authenticate(self.tokens["access"])
+        with self.assertNumQueries(0):
+            request = self.authenticate(self.tokens["access"])
+            self.assertEqual(request.user.pk, self.user.pk)
+            self.assertFalse(IsModer().has_permission(request, None))
+        with self.assertNumQueries(1):
+            self.assertEqual(request.user.email, "stateless@test.ru")
+
+    def test_group_change_revokes_token(self):
+        """После изменения групп старый токен отклоняется, а обновленный содержит новую роль."""
+        self.user.groups.add(Group.objects.create(name="moders"))
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.tokens["access"])
+
+        response = self.client.post(reverse("users:token_refresh"), {"refresh": self.tokens["refresh"]})
+        request = self.authenticate(response.json()["access"])
+        self.assertTrue(IsModer().has_permission(request, None))
+
+    def test_deactivation_revokes_token(self):
+        """Деактивированный пользователь не проходит аутентификацию по старому токену."""
+        self.authenticate(self.tokens["access"])
+        User.objects.filter(pk=self.user.pk).update(last_login=timezone.now() - timedelta(days=40))
+        deactivate_user()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.tokens["access"])
+
+        response = self.client.post(reverse("users:token_refresh"), {"refresh": self.tokens["refresh"]})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_version_not_writable(self):
+        """Версию токенов нельзя задать через API пользователя."""
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(
+            reverse("users:register"), {"email": "new@test.ru", "password": "password", "token_version": 5}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["token_version"], 0)
+        self.assertEqual(User.objects.get(email="new@test.ru").token_version, 0)
@@ -2,7 +2,7 @@ from django.urls import path
 from rest_framework_simplejwt.views import (TokenObtainPairView,
                                             TokenRefreshView)
 from users.apps import UsersConfig
-from users.views import PaymentListView, UserCreateAPIView
+from users.views import PaymentExportView, PaymentListView, PaymentReportView, PaymentStatusView, UserCreateAPIView
 from rest_framework.permissions import AllowAny
 
 app_name = UsersConfig.name
@@ -10,6 +10,9 @@ app_name = UsersConfig.name
 urlpatterns = [
     path("payments/", PaymentListView.as_view(), name="payment_list"),
     path("payments/<int:course_id>/", PaymentListView.as_view(), name="payment_create"),
+    path("payments/report/", PaymentReportView.as_view(), name="payment_report"),
+    path("payments/export/", PaymentExportView.as_view(), name="payment_export"),
+    path("payments/<int:pk>/status/", PaymentStatusView.as_view(), name="payment_status"),
     path("register/", UserCreateAPIView.as_view(), name="register"),
     path("login/", TokenObtainPairView.as_view(permission_classes=(AllowAny,)), name="login",),
     path("token/refresh/", TokenRefreshView.as_view(permission_classes=(AllowAny,)), name="token_refresh",),
@@ -1,13 +1,22 @@
+from django.db import transaction
+from django.db.models import Sum
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models.functions import TruncMonth
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets
-from rest_framework.generics import ListCreateAPIView, CreateAPIView
-from rest_framework.permissions import AllowAny
-from users.services import create_session
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import ListCreateAPIView, CreateAPIView, RetrieveAPIView
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from materials.models import Course
-from users.filters import PaymentFilter
-from users.models import Payment, User
-from users.serializers import PaymentSerializer, UserSerializer
-import stripe
+from users.exports import EXPORT_FORMATS, aiterate
+from users.filters import PaymentFilter, PaymentRollupFilter
+from users.models import Payment, PaymentDailyRollup, User
+from users.serializers import PaymentSerializer, PaymentStatusSerializer, UserSerializer
+from users.tasks import create_payment_session
 
 
 class PaymentViewSet(viewsets.ModelViewSet):
@@ -29,19 +38,79 @@ class PaymentListView(ListCreateAPIView):
         # Извлекаем course_id из тела url запроса
         course_id = self.kwargs.get('course_id')
         # Получаем объект курса по ID
-        course = Course.objects.get(id=course_id)
+        course = get_object_or_404(Course, id=course_id)
         # Сохраняем платеж с указанием пользователя и оплаченного курса
         payment = serializer.save(user=self.request.user, paid_course=course)
+        # Сессия Stripe создается в фоне, клиент опрашивает статус платежа
+        transaction.on_commit(lambda: create_payment_session.delay(payment.pk))
 
-        try:
-            course_name = course.title
-            session_id, payment_link = create_session(payment.payment_amount, f'к оплате {course_name}')
-            payment.session_id = session_id
-            payment.payment_link = payment_link
-            payment.save()
-        except stripe.error.StripeError as e:
-            print(f"Ошибка при создании сессии Stripe: {e}")
-            raise
+
+class PaymentStatusView(RetrieveAPIView):
+    """Возвращает статус платежа и ссылку на оплату, когда она готова"""
+
+    serializer_class = PaymentStatusSerializer
+
+    def get_queryset(self):
+        return Payment.objects.filter(user=self.request.user)
+
+
+class PaymentExportView(APIView):
+    """
+    Потоковая выгрузка платежей с фильтрами PaymentFilter.
+    Параметр file_format: csv (по умолчанию) или ndjson; память не растет с числом платежей
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        file_format = request.query_params.get("file_format", "csv")
+        if file_format not in EXPORT_FORMATS:
+            raise ValidationError({"file_format": [f"Допустимые значения: {', '.join(EXPORT_FORMATS)}"]})
+        filterset = PaymentFilter(request.query_params, queryset=Payment.objects.all())
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+
+        export, content_type = EXPORT_FORMATS[file_format]
+        content = export(filterset.qs)
+        if isinstance(request._request, ASGIRequest):
+            content = aiterate(content)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="payments.{file_format}"'
+        return response
+
+
+class PaymentReportView(APIView):
+    """
+    Отчет о выручке по итогам платежей за день.
+    Параметр group_by: day (по умолчанию), month, course или payment_method
+    """
+
+    permission_classes = (IsAdminUser,)
+    group_by_choices = ("day", "month", "course", "payment_method")
+
+    def get(self, request, *args, **kwargs):
+        filterset = PaymentRollupFilter(request.query_params, queryset=PaymentDailyRollup.objects.all())
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+
+        group_by = request.query_params.get("group_by", "day")
+        if group_by not in self.group_by_choices:
+            raise ValidationError({"group_by": f"Допустимые значения: {', '.join(self.group_by_choices)}"})
+
+        rollups = filterset.qs.order_by()
+        grouped = rollups.annotate(month=TruncMonth("day")) if group_by == "month" else rollups
+        results = (
+            grouped.values(group_by)
+            .annotate(total_amount=Sum("total_amount"), payments_count=Sum("payments_count"))
+            .order_by(group_by)
+        )
+
+        totals = rollups.aggregate(total_amount=Sum("total_amount"), payments_count=Sum("payments_count"))
+        return Response({
+            "total_amount": totals["total_amount"] or 0,
+            "payments_count": totals["payments_count"] or 0,
+            "results": list(results),
+        })
 
 
 class UserCreateAPIView(CreateAPIView):